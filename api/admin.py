@@ -1,4 +1,16 @@
 from django.contrib import admin
-from .models import Post
+from . import jobs
+from .models import Post, Job
 # Register your models here.
-admin.site.register(Post)
\ No newline at end of file
+admin.site.register(Post)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'name')
+    actions = ['requeue']
+
+    @admin.action(description="Requeue selected dead jobs")
+    def requeue(self, request, queryset):
+        jobs.requeue_dead(pk__in=queryset.values('pk'))
@@ -0,0 +1,187 @@
+"""
+Async versions of the read-heavy views, routed instead of the sync ones
+when ASYNC_VIEWS is on (backend/asgi.py turns it on).
+
+They share everything but the I/O with their sync twins in views.py: the
+querysets, ETags and response building come from there, and only the
+evaluation differs - async iteration, ain_bulk(), aget(). Per-viewer sets
+the serializers would otherwise load lazily (likes, follows) are loaded
+first, so serializing never touches the database from the event loop.
+"""
+from inspect import iscoroutine
+
+from asgiref.sync import sync_to_async
+from rest_framework.decorators import permission_classes
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import etags
+from .models import Follow, Profile
+from .pagination import UserSearchPagination
+from .response_cache import cache_response, profile_versions
+from .serializers import aviewer_following_ids, liked_post_ids
+from .views import (
+    create_post, follow_page_queryset, follow_page_response, follow_search_query, post_list_queryset,
+    post_page_etag, post_page_queryset, post_page_response, post_paginator, profile_not_found,
+    profile_page_response, profile_response, profile_stamp_queryset, user_search_queryset,
+)
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView with coroutine handlers. Authentication, permissions and
+    throttles stay sync (JWT auth looks the user up) and run in a thread
+    before the handler.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            # OPTIONS is still answered by APIView's sync handler
+            if iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def async_api_view(http_method_names):
+    """@api_view for `async def` views; the DRF policy decorators work as usual"""
+    def decorator(func):
+        async def handler(self, *args, **kwargs):
+            return await func(*args, **kwargs)
+
+        attrs = {'__doc__': func.__doc__, '__module__': func.__module__}
+        attrs['http_method_names'] = [method.lower() for method in {*http_method_names, 'options'}]
+        for method in http_method_names:
+            attrs[method.lower()] = handler
+        for policy in ('renderer_classes', 'parser_classes', 'authentication_classes',
+                       'throttle_classes', 'permission_classes'):
+            attrs[policy] = getattr(func, policy, getattr(APIView, policy))
+
+        return type(func.__name__, (AsyncAPIView,), attrs).as_view()
+    return decorator
+
+
+async def apaginate(paginator, queryset, request):
+    if hasattr(paginator, 'apaginate_queryset'):
+        return await paginator.apaginate_queryset(queryset, request)
+    # Page numbers need a COUNT through Django's sync Paginator
+    return await sync_to_async(paginator.paginate_queryset)(queryset, request)
+
+
+async def current_profile(request):
+    return await Profile.objects.aget(user_id=request.user.pk)
+
+
+@async_api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+@cache_response('post_list', lambda request: ['posts'])
+async def post_api(request):
+    if request.method == 'POST':
+        return await sync_to_async(create_post)(request)
+
+    search = request.GET.get("search", "").strip()
+
+    paginator = post_paginator(request, search)
+    page = await apaginate(paginator, post_page_queryset(search), request)
+    etag = post_page_etag(request, paginator, page)
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+
+    ids = [post.id for post in page]
+    loaded = await post_list_queryset().ain_bulk(ids)
+    context = {}
+    if request.user.is_authenticated:
+        context['liked_post_ids'] = {post_id async for post_id in liked_post_ids(request.user, ids)}
+    return post_page_response(request, paginator, page, loaded, etag, context)
+
+
+@async_api_view(['GET'])
+@cache_response('user_profile', lambda request, username: profile_versions(username))
+async def user_profile(request, username):
+    """Get user profile with follow status"""
+    stamp = await profile_stamp_queryset(username).afirst()
+    if stamp is None:
+        return profile_not_found()
+
+    etag = etags.make_etag(etags.viewer(request), username, stamp)
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+
+    profile = await Profile.objects.select_related('user').aget(user__username=username)
+    if request.user.is_authenticated:
+        await aviewer_following_ids(request)
+    return profile_response(request, profile, etag)
+
+
+async def follow_list_response(request, links, side, total_count, key):
+    paginator, links = follow_page_queryset(request, links, side)
+    if follow_search_query(request):
+        total_count = await links.acount()
+    page = await paginator.apaginate_queryset(links, request)
+    await aviewer_following_ids(request)
+    return follow_page_response(request, paginator, page, side, total_count, key)
+
+
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def get_followers(request):
+    """Get users who follow the current user with search, newest first"""
+    profile = await current_profile(request)
+    return await follow_list_response(
+        request,
+        Follow.objects.filter(profile=profile),
+        'follower',
+        profile.followers_count,
+        'followers',
+    )
+
+
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def get_following(request):
+    """Get users that the current user is following with search, newest first"""
+    profile = await current_profile(request)
+    return await follow_list_response(
+        request,
+        Follow.objects.filter(follower=profile),
+        'profile',
+        profile.following_count,
+        'following',
+    )
+
+
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def search_users(request):
+    """
+    Search users by username, exact and prefix matches first
+    """
+    query = request.query_params.get('q', '').strip()
+
+    if not query:
+        return Response({'next': None, 'results': []})
+
+    paginator = UserSearchPagination()
+    queryset = user_search_queryset(await current_profile(request), query)
+    page = await paginator.apaginate_queryset(queryset, request)
+    await aviewer_following_ids(request)
+    return profile_page_response(request, paginator, page)
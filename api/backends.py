@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+
+UserModel = get_user_model()
+
+
+class EmailOrUsernameModelBackend(ModelBackend):
+    """
+    ModelBackend that also accepts an email address as the username.
+
+    One query looks the identifier up in both (indexed) columns and the
+    password is hashed exactly once, whether or not the user exists.
+    Usernames are unique and emails aren't, so a username match wins,
+    then the oldest account with that email.
+    """
+
+    def candidates(self, identifier):
+        return (
+            UserModel._default_manager
+            .filter(Q(username=identifier) | Q(email=identifier))
+            .order_by('id')[:5]
+        )
+
+    def pick(self, users, identifier):
+        for user in users:
+            if user.username == identifier:
+                return user
+        return users[0] if users else None
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+
+        user = self.pick(list(self.candidates(username)), username)
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user (#20760).
+            UserModel().set_password(password)
+        elif user.check_password(password) and self.user_can_authenticate(user):
+            return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+
+        user = self.pick([user async for user in self.candidates(username)], username)
+        if user is None:
+            UserModel().set_password(password)
+        elif await user.acheck_password(password) and self.user_can_authenticate(user):
+            return user
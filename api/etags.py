@@ -0,0 +1,57 @@
+"""
+Conditional GETs for the read endpoints.
+
+A view computes a weak ETag from a handful of cheap values - row ids and
+`updated_at` stamps, plus the viewer, since responses carry per-viewer
+fields - before it serializes anything. When the client's If-None-Match
+matches, it answers 304 without running the serializer; otherwise it
+serializes as usual and tags the response.
+
+`updated_at` moves on every save and on every counter update (see
+signals.py), so a like, comment or follow changes the tag of every
+response that shows it.
+"""
+import hashlib
+
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    """Weak ETag over `parts`; anything with a stable repr() will do"""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def viewer(request):
+    """The per-viewer part of every tag, plus the negotiated format"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return (request.user.pk, getattr(renderer, 'format', None))
+
+
+def _opaque(tag):
+    # Weak comparison ignores the W/ prefix (RFC 9110, 8.8.3.2)
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(',')}
+
+
+def not_modified(etag):
+    return tag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+
+def tag(response, etag):
+    """Set the validator headers on a full or 304 response"""
+    response['ETag'] = etag
+    # Caches may store it but have to revalidate, and per viewer
+    response['Cache-Control'] = 'private, no-cache'
+    response['Vary'] = 'Accept, Authorization'
+    return response
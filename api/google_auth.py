@@ -0,0 +1,176 @@
+"""
+Google ID-token verification against cached signing keys.
+
+Google publishes the certificates it signs ID tokens with and rotates them
+every few days, announcing the lifetime in the Cache-Control max-age of
+the certs response. Keys are kept in process memory and in the shared
+Django cache until then, refreshed in a background thread shortly before
+they expire, and tokens are verified locally - a login makes no outbound
+HTTP request in the common case.
+
+The fetcher is ``settings.GOOGLE_CERTS_FETCHER``, a dotted path to a
+callable returning ``(certs, max_age)``; tests point it at a local key set.
+"""
+import base64
+import json
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+CACHE_KEY = 'google_auth:certs'
+
+# Used when the response has no usable max-age
+DEFAULT_MAX_AGE = 60 * 60
+# Start a background refresh this long before the keys expire
+REFRESH_MARGIN = 5 * 60
+# A token signed by an unknown key forces a refetch at most this often
+UNKNOWN_KEY_REFETCH_INTERVAL = 60
+CLOCK_SKEW = 10
+
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def fetch_google_certs():
+    """Download Google's current certificates; returns (certs, max_age)"""
+    import requests
+
+    response = requests.get(CERTS_URL, timeout=5)
+    response.raise_for_status()
+    match = _MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+    max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE
+    return response.json(), max_age
+
+
+class KeyCache:
+    """Process-local copy of the signing keys, backed by the Django cache"""
+
+    def __init__(self):
+        self.certs = None
+        self.expires_at = 0
+        self.last_forced_fetch = 0
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def get(self):
+        now = time.time()
+        if self.certs is not None and now < self.expires_at:
+            if self.expires_at - now < REFRESH_MARGIN:
+                self.refresh_in_background()
+            return self.certs
+
+        with self.lock:
+            # Another thread may have loaded them while we waited
+            if self.certs is not None and time.time() < self.expires_at:
+                return self.certs
+            if self.load_shared():
+                return self.certs
+            try:
+                return self.fetch()
+            except Exception:
+                if self.certs is None:
+                    raise
+                # Expired keys beat failing every login while Google is unreachable
+                logger.exception('Refreshing Google signing keys failed, using expired keys')
+                return self.certs
+
+    def get_for(self, key_id):
+        """Keys including `key_id`, refetching once if Google rotated to it"""
+        certs = self.get()
+        if not key_id or key_id in certs:
+            return certs
+
+        with self.lock:
+            if key_id not in self.certs and time.time() - self.last_forced_fetch > UNKNOWN_KEY_REFETCH_INTERVAL:
+                self.last_forced_fetch = time.time()
+                try:
+                    self.fetch()
+                except Exception:
+                    logger.exception('Refetching Google signing keys failed')
+            return self.certs
+
+    def load_shared(self):
+        shared = cache.get(CACHE_KEY)
+        if shared and shared['expires_at'] > time.time():
+            self.certs, self.expires_at = shared['certs'], shared['expires_at']
+            return True
+        return False
+
+    def fetch(self):
+        certs, max_age = import_string(settings.GOOGLE_CERTS_FETCHER)()
+        self.certs, self.expires_at = certs, time.time() + max_age
+        cache.set(CACHE_KEY, {'certs': certs, 'expires_at': self.expires_at}, max_age)
+        return certs
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self):
+        try:
+            # Another worker may already have refreshed the shared copy
+            shared = cache.get(CACHE_KEY)
+            if shared and shared['expires_at'] - time.time() > REFRESH_MARGIN:
+                self.certs, self.expires_at = shared['certs'], shared['expires_at']
+            else:
+                self.fetch()
+        except Exception:
+            # Keep using the current keys; the next login retries
+            logger.exception('Refreshing Google signing keys failed')
+        finally:
+            self.refreshing = False
+
+    def clear(self):
+        self.certs, self.expires_at, self.last_forced_fetch = None, 0, 0
+        cache.delete(CACHE_KEY)
+
+
+keys = KeyCache()
+
+
+def _key_id(token):
+    header = token.split('.', 1)[0]
+    padded = header + '=' * (-len(header) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded)).get('kid')
+
+
+def verify_id_token(token, audience=None):
+    """
+    Verify a Google ID token and return its claims. Raises ValueError for
+    malformed, expired or badly signed tokens and for foreign issuers.
+    """
+    if not token or not isinstance(token, str):
+        raise ValueError('Missing token')
+    try:
+        key_id = _key_id(token)
+    except (ValueError, UnicodeDecodeError, AttributeError):
+        raise ValueError('Malformed token')
+
+    # google.auth pulls in cryptography; only logins need it
+    from google.auth import exceptions, jwt
+
+    certs = keys.get_for(key_id)
+    try:
+        idinfo = jwt.decode(
+            token,
+            certs=certs,
+            audience=audience or settings.GOOGLE_CLIENT_ID,
+            clock_skew_in_seconds=CLOCK_SKEW,
+        )
+    except exceptions.GoogleAuthError as exc:
+        raise ValueError(str(exc))
+
+    if idinfo.get('iss') not in ISSUERS:
+        raise ValueError('Wrong issuer')
+    return idinfo
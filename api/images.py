@@ -0,0 +1,165 @@
+"""
+Resized variants of uploaded images.
+
+Every post image and avatar gets a fixed set of downscaled copies, stored
+next to the original as ``<name>.<variant>.<digest>.<ext>`` (WebP when
+Pillow was built with it, JPEG otherwise). The digest is a hash of the
+variant's own bytes, so re-encoding with other settings never reuses a
+name and the files can be cached as immutable. The storage names live in
+a JSON column on the model, and the serializers turn them into a
+variant -> URL map so clients can pick the smallest one that fits.
+
+Variants are (re)built from the post_save signals whenever the file name
+changes; ``manage.py build_image_variants`` backfills existing media.
+"""
+import functools
+import hashlib
+import io
+import logging
+import os
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels; images are never upscaled
+VARIANTS = {
+    'thumb': 160,
+    'card': 640,
+    'full': 1600,
+}
+
+QUALITY = 80
+
+# Hex characters of the variant's content hash kept in its name
+DIGEST_LENGTH = 12
+
+
+# Pillow is imported on first use, not when the app loads
+@functools.cache
+def use_webp():
+    from PIL import features
+    return features.check('webp')
+
+
+def extension():
+    return 'webp' if use_webp() else 'jpg'
+
+
+def variant_name(name, variant, content):
+    """Storage name of `variant` of the original at `name`, encoded as `content`"""
+    root, _ = os.path.splitext(name)
+    digest = hashlib.sha256(content).hexdigest()[:DIGEST_LENGTH]
+    return f'{root}.{variant}.{digest}.{extension()}'
+
+
+def is_current(name, variants):
+    """True when `variants` were built from the file at `name`"""
+    if not name:
+        return not variants
+    if set(variants or ()) != set(VARIANTS):
+        return False
+    root = re.escape(os.path.splitext(name)[0])
+    return all(
+        re.fullmatch(rf'{root}\.{variant}\.[0-9a-f]{{{DIGEST_LENGTH}}}\.{extension()}', stored)
+        for variant, stored in variants.items()
+    )
+
+
+def _prepare(img):
+    from PIL import Image, ImageOps
+
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    if has_alpha and use_webp():
+        return img.convert('RGBA')
+    if has_alpha:
+        # JPEG has no alpha channel; flatten onto white
+        rgba = img.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def _encode(img):
+    buffer = io.BytesIO()
+    if use_webp():
+        img.save(buffer, 'WEBP', quality=QUALITY, method=4)
+    else:
+        img.save(buffer, 'JPEG', quality=QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def render_variants(name, storage=None):
+    """
+    Build every variant of the original at `name` and return
+    {variant: storage name}. Only touches storage, never the database, so
+    it is safe to run in worker processes.
+    """
+    from PIL import Image
+
+    storage = storage or default_storage
+    names = {}
+
+    with storage.open(name, 'rb') as original, Image.open(original) as img:
+        img.draft('RGB', (max(VARIANTS.values()),) * 2)
+        source = _prepare(img)
+
+    # Largest first, so each smaller variant resizes an already smaller image
+    for variant, size in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+        source.thumbnail((size, size), Image.Resampling.LANCZOS)
+        content = _encode(source)
+        target = variant_name(name, variant, content)
+        # Same name, same bytes: a rebuild that changed nothing keeps the file
+        if not storage.exists(target):
+            target = storage.save(target, ContentFile(content))
+        names[variant] = target
+
+    return names
+
+
+def delete_variants(variants, keep=(), storage=None):
+    storage = storage or default_storage
+    for stored in (variants or {}).values():
+        if stored not in keep:
+            storage.delete(stored)
+
+
+def sync_variants(instance, field, variants_field):
+    """
+    Rebuild `instance`'s variants if its image changed since they were
+    built, and drop the stale ones. Failures are logged and leave the
+    variants empty, so clients fall back to the original.
+    """
+    file = getattr(instance, field)
+    old = getattr(instance, variants_field) or {}
+    if is_current(file.name, old):
+        return
+
+    from PIL import Image
+
+    new = {}
+    if file:
+        try:
+            new = render_variants(file.name, file.storage)
+        except (OSError, Image.DecompressionBombError):
+            logger.exception('Could not build variants for %s', file.name)
+
+    delete_variants(old, keep=set(new.values()), storage=file.storage)
+    # updated_at moves too: the variant URLs are part of the serialized row
+    type(instance).objects.filter(pk=instance.pk).update(**{variants_field: new}, updated_at=timezone.now())
+    setattr(instance, variants_field, new)
+
+
+def variant_urls(file, variants, request=None):
+    """{variant: URL} for the serializers; empty until the variants exist"""
+    if not file or not is_current(file.name, variants):
+        return {}
+    urls = {variant: file.storage.url(stored) for variant, stored in variants.items()}
+    if request is not None:
+        urls = {variant: request.build_absolute_uri(url) for variant, url in urls.items()}
+    return urls
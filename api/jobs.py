@@ -0,0 +1,120 @@
+"""
+A small database-backed job queue.
+
+Views call ``enqueue()`` instead of doing slow work (SMTP) inline. The
+job row is an ordinary insert, so call it in the same transaction.atomic()
+block as the write it reports on; a rolled-back write then never leaves a
+job behind. ``manage.py run_jobs`` claims due jobs, runs the registered
+task and deletes the row on success.
+
+A failed job is retried with exponential backoff until it runs out of
+attempts, then stays in the table with status "dead" and its last
+traceback, for inspection in the admin.
+"""
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY = 30  # seconds before the first retry, doubled after each failure
+RETRY_MAX_DELAY = 60 * 60
+
+# Jobs still "running" after this long belong to a worker that died
+LOCK_TIMEOUT = timedelta(minutes=10)
+
+_tasks = {}
+
+
+def task(name):
+    """Register a function as the handler for jobs called `name`"""
+    def register(func):
+        _tasks[name] = func
+        return func
+    return register
+
+
+def enqueue(name, delay=0, max_attempts=5, **payload):
+    if name not in _tasks:
+        raise ValueError(f'Unknown task: {name}')
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def retry_delay(attempts):
+    delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+    # Jitter, so jobs that failed together don't all retry together
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def release_stale():
+    """Put jobs left "running" by a crashed worker back in the queue"""
+    return Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - LOCK_TIMEOUT,
+    ).update(status=Job.PENDING, locked_by='', locked_at=None)
+
+
+def claim(batch_size):
+    """
+    Mark up to `batch_size` due jobs as running for this worker and return
+    them. SKIP LOCKED lets several workers poll at once on PostgreSQL; the
+    conditional UPDATE keeps the claim safe where it isn't supported.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.PENDING, run_at__lte=now)
+            .order_by('run_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        Job.objects.filter(id__in=ids, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            locked_by=token,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING).order_by('run_at', 'id'))
+
+
+def run(job):
+    """Run one claimed job; returns True if it succeeded"""
+    func = _tasks.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'No task registered as {job.name!r}')
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s failed for good after %s attempts', job, job.attempts)
+            fields = {'status': Job.DEAD}
+        else:
+            logger.warning('Job %s failed, retrying', job)
+            fields = {'status': Job.PENDING, 'run_at': timezone.now() + retry_delay(job.attempts)}
+        Job.objects.filter(pk=job.pk).update(locked_by='', locked_at=None, last_error=error, **fields)
+        return False
+
+    Job.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def requeue_dead(**filters):
+    """Give dead jobs a fresh set of attempts"""
+    return Job.objects.filter(status=Job.DEAD, **filters).update(
+        status=Job.PENDING, attempts=0, run_at=timezone.now(), last_error='',
+    )
@@ -0,0 +1,172 @@
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/api/Post/', '/api/profile/{username}/', '/api/followers/', '/api/users/search/?q=a']
+# Anonymous runs can only read the public endpoints
+ANONYMOUS_PATHS = ['/api/Post/']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent read throughput of the sync views under WSGI and the "
+        "async views under ASGI, each driven in-process in its own subprocess"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Send requests as this user (anonymous reads are served from the response cache)")
+        parser.add_argument('--path', action='append', dest='paths', help="Path to request, repeatable; {username} is filled in")
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=20, help="Clients with a request in flight")
+        parser.add_argument('--wsgi-threads', type=int, default=1, help="Requests a WSGI worker serves at once (gunicorn --threads)")
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], help="Run one side only and print JSON (used by the parent run)")
+
+    def handle(self, *args, **options):
+        username = options['username']
+        paths = options['paths'] or (DEFAULT_PATHS if username else ANONYMOUS_PATHS)
+        paths = [path.format(username=username) for path in paths]
+
+        headers = {}
+        if username:
+            from rest_framework_simplejwt.tokens import AccessToken
+            try:
+                user = User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"No user {username!r}")
+            headers['authorization'] = f'Bearer {AccessToken.for_user(user)}'
+
+        urls = [paths[i % len(paths)] for i in range(max(1, options['requests']))]
+
+        if options['mode'] == 'wsgi':
+            result = run_wsgi(urls, headers, options['concurrency'], options['wsgi_threads'])
+        elif options['mode'] == 'asgi':
+            result = asyncio.run(run_asgi(urls, headers, options['concurrency']))
+        else:
+            self.compare(options)
+            return
+        self.stdout.write(json.dumps(result))
+
+    def compare(self, options):
+        argv = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_async']
+        for option in ('username', 'requests', 'concurrency', 'wsgi_threads'):
+            if options[option] is not None:
+                argv += [f'--{option.replace("_", "-")}', str(options[option])]
+        for path in options['paths'] or ():
+            argv += ['--path', path]
+
+        self.stdout.write(
+            f"{options['requests']} requests, {options['concurrency']} concurrent clients, "
+            f"{options['wsgi_threads']} WSGI thread(s)"
+        )
+        self.stdout.write(f"{'mode':<6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for mode in ('wsgi', 'asgi'):
+            # urls.py picks the views at import time, so each side gets a process
+            env = {**os.environ, 'ASYNC_VIEWS': str(mode == 'asgi')}
+            child = subprocess.run(argv + ['--mode', mode], env=env, capture_output=True, text=True)
+            if child.returncode:
+                raise CommandError(f"{mode} run failed:\n{child.stderr}")
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            self.stdout.write(
+                f"{mode:<6}{result['rps']:>10.1f}{result['p50'] * 1000:>10.1f}"
+                f"{result['p95'] * 1000:>10.1f}{result['errors']:>8}"
+            )
+
+
+def _host():
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    return hosts[0] if hosts else 'localhost'
+
+
+def _summary(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0],
+        'errors': sum(status >= 400 for status in statuses),
+    }
+
+
+def run_wsgi(urls, headers, concurrency, threads):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    app = WSGIHandler()
+    host = _host()
+    # The server only has `threads` request slots; the rest of the clients wait
+    slots = threading.Semaphore(threads)
+
+    def call(url):
+        path, _, query = url.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+            'SERVER_NAME': host, 'SERVER_PORT': '443', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': host, 'wsgi.url_scheme': 'https', 'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr, 'wsgi.multithread': threads > 1,
+            **{f'HTTP_{name.upper()}': value for name, value in headers.items()},
+        }
+        statuses = []
+        start = time.perf_counter()
+        with slots:
+            body = app(environ, lambda status, response_headers, exc_info=None: statuses.append(status))
+            for _ in body:
+                pass
+            body.close()
+        return time.perf_counter() - start, int(statuses[0].split()[0])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        results = list(clients.map(call, urls))
+    elapsed = time.perf_counter() - start
+    return _summary([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+async def run_asgi(urls, headers, concurrency):
+    from django.core.handlers.asgi import ASGIHandler
+
+    app = ASGIHandler()
+    host = _host()
+    clients = asyncio.Semaphore(concurrency)
+
+    async def call(url):
+        path, _, query = url.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'https', 'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'server': (host, 443), 'client': ('127.0.0.1', 0),
+            'headers': [(b'host', host.encode())] + [(name.encode(), value.encode()) for name, value in headers.items()],
+        }
+        received = False
+        statuses = []
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Django listens for a disconnect until the response is sent
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        async with clients:
+            start = time.perf_counter()
+            await app(scope, receive, send)
+            return time.perf_counter() - start, statuses[0]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call(url) for url in urls))
+    elapsed = time.perf_counter() - start
+    return _summary([latency for latency, _ in results], [status for _, status in results], elapsed)
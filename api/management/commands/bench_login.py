@@ -0,0 +1,63 @@
+import time
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+PASSWORD = 'Bench-login-123'
+
+
+def legacy_login(identifier, password):
+    """The old /api/token/ path: two lookups, then two full authenticate() calls"""
+    user = (
+        User.objects.filter(email=identifier).first()
+        or User.objects.filter(username=identifier).first()
+    )
+    if not user:
+        return None
+    backend = ModelBackend()
+    user = backend.authenticate(None, username=user.username, password=password)
+    if user:
+        # TokenObtainPairSerializer.validate() authenticated a second time
+        user = backend.authenticate(None, username=user.username, password=password)
+    return user
+
+
+def current_login(identifier, password):
+    return authenticate(None, username=identifier, password=password)
+
+
+class Command(BaseCommand):
+    help = "Compare CPU time per login for the old and the current authentication path"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        iterations = max(1, options['iterations'])
+
+        # The throwaway user is rolled back afterwards
+        with transaction.atomic():
+            User.objects.create_user('bench-login', 'bench-login@example.com', PASSWORD)
+
+            results = {}
+            for label, login in (('before', legacy_login), ('after', current_login)):
+                for identifier in ('bench-login', 'bench-login@example.com'):
+                    assert login(identifier, PASSWORD) is not None, f'{label} login failed'
+                results[label] = self.measure(login, iterations)
+
+            transaction.set_rollback(True)
+
+        for label, per_login in results.items():
+            self.stdout.write(f"{label:>6}: {per_login * 1000:.1f} ms CPU per login")
+        self.stdout.write(f"after/before: {results['after'] / results['before']:.2f}")
+
+    def measure(self, login, iterations):
+        start = time.process_time()
+        for i in range(iterations):
+            # Alternate between username and email logins
+            identifier = 'bench-login' if i % 2 else 'bench-login@example.com'
+            login(identifier, PASSWORD)
+        return (time.process_time() - start) / iterations
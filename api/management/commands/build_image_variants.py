@@ -0,0 +1,92 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from api import images, response_cache
+from api.models import Post, Profile
+
+# (model, image field, variants field)
+TARGETS = [
+    (Post, 'image', 'image_variants'),
+    (Profile, 'avatar', 'avatar_variants'),
+]
+
+
+def _init_worker():
+    # Needed where workers are spawned rather than forked
+    django.setup()
+
+
+def _render(name):
+    try:
+        return images.render_variants(name), None
+    except Exception as exc:
+        return None, f'{type(exc).__name__}: {exc}'
+
+
+class Command(BaseCommand):
+    help = "Build resized variants for post images and avatars that don't have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (default: one per CPU)",
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Rebuild variants even when they look current",
+        )
+
+    def handle(self, *args, **options):
+        pending = []
+        for model, field, variants_field in TARGETS:
+            rows = (
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list('pk', 'user_id', field, variants_field)
+                .iterator()
+            )
+            for pk, user_id, name, variants in rows:
+                if options['force'] or not images.is_current(name, variants):
+                    pending.append((model, field, variants_field, pk, user_id, name, variants))
+
+        if not pending:
+            self.stdout.write("All image variants are up to date")
+            return
+
+        self.stdout.write(f"Building variants for {len(pending)} image(s)")
+
+        # Forked workers must not inherit open database connections
+        connections.close_all()
+
+        built = failed = 0
+        changed_users = set()
+        with ProcessPoolExecutor(max_workers=max(1, options['workers']), initializer=_init_worker) as pool:
+            futures = {pool.submit(_render, item[5]): item for item in pending}
+            for future in as_completed(futures):
+                model, field, variants_field, pk, user_id, name, old = futures[future]
+                variants, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+
+                images.delete_variants(old, keep=set(variants.values()))
+                # Skip rows whose image was replaced meanwhile; the signal handled those.
+                # updated_at moves too, as in images.sync_variants: it feeds the ETags
+                updated = model.objects.filter(pk=pk, **{field: name}).update(
+                    **{variants_field: variants}, updated_at=timezone.now(),
+                )
+                if updated:
+                    changed_users.add(user_id)
+                built += 1
+
+        # Variant URLs show up in post lists (avatars too) and on profiles
+        if changed_users:
+            response_cache.bump('posts', *(f'profile:{user_id}' for user_id in changed_users))
+        self.stdout.write(f"Built variants for {built} image(s), {failed} failed")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Resync the post full-text index (needed on SQLite after bulk writes)"
+
+    def handle(self, *args, **options):
+        get_backend().rebuild()
+        self.stdout.write("Post search index rebuilt")
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from api.models import Post, Like, Comment, Profile, Follow
+
+BATCH_SIZE = 1000
+
+
+def _count_subquery(model, fk):
+    # Correlated COUNT(*) of `model` rows pointing at the outer row
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(c=Count('pk'))
+            .values('c')
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized counters that have drifted from the real row counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report drifted rows, don't fix them",
+        )
+
+    def handle(self, *args, **options):
+        actual = {
+            'likes_count': _count_subquery(Like, 'post'),
+            'comments_count': _count_subquery(Comment, 'post'),
+        }
+        self.reconcile(Post, actual, options['dry_run'])
+
+        actual = {
+            'followers_count': _count_subquery(Follow, 'profile'),
+            'following_count': _count_subquery(Follow, 'follower'),
+            'posts_count': _count_subquery(Post, 'user__profile'),
+        }
+        self.reconcile(Profile, actual, options['dry_run'])
+
+    def reconcile(self, model, actual, dry_run):
+        annotations = {f'actual_{field}': expr for field, expr in actual.items()}
+        drift = Q()
+        for field in actual:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+
+        drifted = list(
+            model.objects.annotate(**annotations).filter(drift).values_list('pk', flat=True)
+        )
+
+        if not dry_run:
+            for start in range(0, len(drifted), BATCH_SIZE):
+                batch = drifted[start:start + BATCH_SIZE]
+                model.objects.filter(pk__in=batch).update(**actual, updated_at=timezone.now())
+
+        verb = "Found" if dry_run else "Fixed"
+        self.stdout.write(f"{verb} {len(drifted)} drifted {model._meta.verbose_name} row(s)")
@@ -0,0 +1,58 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (emails) until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Run every job that is due, then exit",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help="Jobs claimed per poll",
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help="Seconds to wait when the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        # Finish the current job on SIGTERM/SIGINT instead of dying mid-send
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        done = failed = 0
+        while not self.stopping:
+            close_old_connections()
+            jobs.release_stale()
+
+            batch = jobs.claim(options['batch_size'])
+            for job in batch:
+                if jobs.run(job):
+                    done += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f"{job} failed (attempt {job.attempts}/{job.max_attempts})")
+
+            if not batch:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(f"Ran {done} job(s), {failed} failed")
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,204 @@
+"""
+Serving uploaded media in production.
+
+Uploads are stored under a hash of their content (`HashedUploadTo`), so a
+name never points at different bytes and those responses can be cached
+for a year as `immutable`. Everything else gets a short max-age.
+
+`serve_media` answers GETs for MEDIA_URL in one of three ways, picked by
+settings.MEDIA_OFFLOAD:
+
+* ``x-accel-redirect``: nginx sends the file from an internal location
+  mapped to MEDIA_ROOT under MEDIA_ACCEL_PREFIX.
+* ``x-sendfile``: Apache (mod_xsendfile) or lighttpd send the file.
+* unset: Django returns a FileResponse, which gunicorn hands to
+  os.sendfile() through wsgi.file_wrapper. Single byte ranges and
+  If-Modified-Since are handled here.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.deconstruct import deconstructible
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+HASH_LENGTH = 20
+CHUNK_SIZE = 64 * 1024
+
+# <hash>.<ext> originals and <hash>.<variant>.<digest>.<ext> resized copies
+# (see images.py); variants named without their own digest can be rewritten
+HASHED_NAME = re.compile(rf'(^|/)[0-9a-f]{{{HASH_LENGTH}}}(\.[a-z]+\.[0-9a-f]{{12}})?\.[A-Za-z0-9]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+@deconstructible
+class HashedUploadTo:
+    """upload_to that names the file after a hash of its content"""
+
+    def __init__(self, prefix, field):
+        self.prefix = prefix
+        self.field = field
+
+    def __call__(self, instance, filename):
+        file = getattr(instance, self.field)
+        if file._committed:
+            # FieldFile.save(name, content) names the file before it
+            # attaches the content; keep the plain, never-immutable name
+            return posixpath.join(self.prefix, filename)
+
+        content = file.file
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in iter(lambda: content.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+        content.seek(0)
+
+        ext = os.path.splitext(filename)[1].lower()
+        return posixpath.join(self.prefix, digest.hexdigest()[:HASH_LENGTH] + ext)
+
+
+def cache_control(path):
+    if HASHED_NAME.search(path):
+        return IMMUTABLE
+    return f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single `bytes=` range, end inclusive, or None to send
+    the whole file. Raises ValueError when the range can't be satisfied.
+    """
+    match = RANGE.match(header.strip()) if header else None
+    # Multiple ranges and other units are allowed to get the full file
+    if not match or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRange:
+    """
+    Bounded view of an open file. Keeps fileno() so a wsgi.file_wrapper
+    can still sendfile() it; the server stops at Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _offload(path, full_path):
+    response = HttpResponse()
+    if settings.MEDIA_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + path)
+    else:
+        response['X-Sendfile'] = full_path
+    # The front server fills in the body, length and ranges
+    del response['Content-Type']
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404
+
+    last_modified = http_date(st.st_mtime)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), st.st_mtime):
+        response = HttpResponseNotModified()
+        response['Last-Modified'] = last_modified
+        response['Cache-Control'] = cache_control(path)
+        return response
+
+    if settings.MEDIA_OFFLOAD:
+        response = _offload(path, full_path)
+    else:
+        response = _file_response(request, full_path, st)
+
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = cache_control(path)
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def _file_response(request, full_path, st):
+    size = st.st_size
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    byte_range = None
+    if not _range_is_stale(request, st):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _range_is_stale(request, st):
+    # If-Range: only honour Range when the client's copy is still current
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return False
+    date = parse_http_date_safe(if_range)
+    return date is None or int(st.st_mtime) > date
@@ -0,0 +1,34 @@
+"""
+Process-wide counters kept in the Django cache, so every worker adds to
+the same numbers when the cache is shared (Redis). With the local-memory
+cache each process counts on its own.
+"""
+from django.core.cache import cache
+
+PREFIX = 'metrics:'
+INDEX_KEY = 'metrics:names'
+
+
+def incr(name, delta=1):
+    key = PREFIX + name
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # First hit for this counter (or the cache was flushed)
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+        names = cache.get(INDEX_KEY) or set()
+        if name not in names:
+            cache.set(INDEX_KEY, names | {name}, None)
+
+
+def snapshot():
+    """{counter name: value} for every counter seen so far"""
+    names = sorted(cache.get(INDEX_KEY) or ())
+    values = cache.get_many([PREFIX + name for name in names])
+    return {name: values.get(PREFIX + name, 0) for name in names}
+
+
+def reset():
+    names = cache.get(INDEX_KEY) or ()
+    cache.delete_many([PREFIX + name for name in names] + [INDEX_KEY])
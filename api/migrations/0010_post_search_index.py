@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:40
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from api.search import get_backend
+    get_backend(schema_editor.connection).install(schema_editor)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from api.search import get_backend
+    get_backend(schema_editor.connection).uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_comment_api_comment_post_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_follow_counters(apps, schema_editor):
+    Profile = apps.get_model('api', 'Profile')
+    Follow = apps.get_model('api', 'Follow')
+
+    followers = Follow.objects.filter(profile=OuterRef('pk')).order_by().values('profile').annotate(c=Count('pk')).values('c')
+    following = Follow.objects.filter(follower=OuterRef('pk')).order_by().values('follower').annotate(c=Count('pk')).values('c')
+
+    Profile.objects.update(
+        followers_count=Coalesce(Subquery(followers), 0),
+        following_count=Coalesce(Subquery(following), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_post_search_index'),
+    ]
+
+    operations = [
+        # Adopt the auto-created api_profile_followers table as an explicit
+        # through model without touching the table itself
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Follow',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('profile', models.ForeignKey(db_column='from_profile_id', on_delete=django.db.models.deletion.CASCADE, related_name='follower_links', to='api.profile')),
+                        ('follower', models.ForeignKey(db_column='to_profile_id', on_delete=django.db.models.deletion.CASCADE, related_name='following_links', to='api.profile')),
+                    ],
+                    options={
+                        'db_table': 'api_profile_followers',
+                        'unique_together': {('profile', 'follower')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='profile',
+                    name='followers',
+                    field=models.ManyToManyField(blank=True, related_name='following', through='api.Follow', through_fields=('profile', 'follower'), to='api.profile'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='follow',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['profile', 'created_at', 'id'], name='api_follow_profile_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', 'created_at', 'id'], name='api_follow_follower_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_follow_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_SIZE = 100
+
+
+def backfill_timelines(apps, schema_editor):
+    Profile = apps.get_model('api', 'Profile')
+    Post = apps.get_model('api', 'Post')
+    Follow = apps.get_model('api', 'Follow')
+    TimelineEntry = apps.get_model('api', 'TimelineEntry')
+
+    for profile in Profile.objects.all():
+        author_user_ids = [profile.user_id] + list(
+            Follow.objects.filter(follower=profile).values_list('profile__user_id', flat=True)
+        )
+        entries = []
+        for user_id in author_user_ids:
+            for post in Post.objects.filter(user_id=user_id).order_by('-id')[:BACKFILL_SIZE]:
+                entries.append(TimelineEntry(viewer=profile, post=post, created_at=post.created_at))
+        TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_follow_through_model_and_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='api.post')),
+                ('viewer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='api.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['viewer', 'created_at', 'post'], name='api_timeline_viewer_idx')],
+                'unique_together': {('viewer', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
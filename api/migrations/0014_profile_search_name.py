@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:32
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Lower
+
+
+def backfill_search_name(apps, schema_editor):
+    Profile = apps.get_model('api', 'Profile')
+    User = apps.get_model('auth', 'User')
+
+    username = User.objects.filter(pk=OuterRef('user_id')).values(name=Lower('username'))
+    Profile.objects.update(search_name=Subquery(username))
+
+
+def install_trigram_index(apps, schema_editor):
+    from api.search import get_backend
+    get_backend(schema_editor.connection).install_profile_index(schema_editor)
+
+
+def uninstall_trigram_index(apps, schema_editor):
+    from api.search import get_backend
+    get_backend(schema_editor.connection).uninstall_profile_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_profile_api_profile_popular_idx'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(backfill_search_name, migrations.RunPython.noop),
+        migrations.RunPython(install_trigram_index, uninstall_trigram_index),
+    ]
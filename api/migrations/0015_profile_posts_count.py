@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_posts_count(apps, schema_editor):
+    Profile = apps.get_model('api', 'Profile')
+    Post = apps.get_model('api', 'Post')
+
+    posts = Post.objects.filter(user_id=OuterRef('user_id')).order_by().values('user_id').annotate(c=Count('pk')).values('c')
+    Profile.objects.update(posts_count=Coalesce(Subquery(posts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_profile_search_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_posts_count, migrations.RunPython.noop),
+    ]
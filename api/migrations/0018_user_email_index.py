@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:43
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_job'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        # Login looks users up by email as well as username (see backends.py);
+        # auth_user is Django's table, so the index is added by hand
+        migrations.RunSQL(
+            "CREATE INDEX IF NOT EXISTS api_auth_user_email_idx ON auth_user (email)",
+            "DROP INDEX IF EXISTS api_auth_user_email_idx",
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:49
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_post_updated_at(apps, schema_editor):
+    # AddField stamped every existing row with the migration time
+    Post = apps.get_model('api', 'Post')
+    Post.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_user_email_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_post_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:51
+
+import api.media
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to=api.media.HashedUploadTo('posts', 'image')),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, upload_to=api.media.HashedUploadTo('profiles', 'avatar')),
+        ),
+    ]
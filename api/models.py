@@ -1,9 +1,26 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .validators import validate_profile_image
+from .media import HashedUploadTo
+from .search import normalize_username
 
 # Create your models here.
 
+def save_without_counters(instance, counter_fields, kwargs):
+    """
+    Leave the denormalized counters out of a full save of an existing row.
+    They are only ever changed with F() updates, so the in-memory values can
+    be stale and writing them back would undo concurrent increments.
+    """
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        kwargs['update_fields'] = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in counter_fields
+        ]
+    return kwargs
+
+
 class Post(models.Model):
     user = models.ForeignKey(
         User,
@@ -13,14 +30,26 @@ class Post(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
     image = models.ImageField(
-        upload_to="posts/",
+        upload_to=HashedUploadTo("posts", "image"),
         null=True,
         blank=True
     )
+    # Storage names of the resized copies of `image` (see images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Moves on every change to the row, counter updates included (ETags)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters, kept in sync by the Like/Comment signals
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    COUNTER_FIELDS = ('likes_count', 'comments_count')
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **save_without_counters(self, self.COUNTER_FIELDS, kwargs))
     
 class Like(models.Model):    
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -35,24 +64,51 @@ class Comment(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Serves both the feed preview and the keyset-paginated thread
+            models.Index(fields=['post', 'created_at', 'id'], name='api_comment_post_created_idx'),
+        ]
+
 class Profile(models.Model):
     # user = models.OneToOneField(User, on_delete=models.CASCADE)
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    avatar = models.ImageField(upload_to="profiles/", null=True, blank=True)
+    avatar = models.ImageField(upload_to=HashedUploadTo("profiles", "avatar"), null=True, blank=True)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(max_length=500, blank=True, null=True)  # Add this
     location = models.CharField(max_length=100, blank=True, null=True)  # Add this
     website = models.URLField(blank=True, null=True)  # Add this
+    # Lowercased username for indexed user search (see search.py)
+    search_name = models.CharField(max_length=150, db_index=True, editable=False, default='')
     followers = models.ManyToManyField(
         'self',
         symmetrical=False,
         related_name='following',
-        blank=True
+        blank=True,
+        through='Follow',
+        through_fields=('profile', 'follower'),
     )
+    # Denormalized counters, kept in sync by the follow and Post signals
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+    # Moves on every change to the row, counter updates included (ETags)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    COUNTER_FIELDS = ('followers_count', 'following_count', 'posts_count')
     
+    class Meta:
+        indexes = [
+            # "Popular profiles" fallback for follow suggestions
+            models.Index(fields=['-followers_count', 'id'], name='api_profile_popular_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
     
     def save(self, *args, **kwargs):
+        self.search_name = normalize_username(self.user.username)
+
         # Delete old avatar when new one is uploaded
         try:
             old = Profile.objects.get(pk=self.pk)
@@ -61,7 +117,7 @@ class Profile(models.Model):
         except Profile.DoesNotExist:
             pass
         
-        super().save(*args, **kwargs)
+        super().save(*args, **save_without_counters(self, self.COUNTER_FIELDS, kwargs))
     
     def delete(self, *args, **kwargs):
         # Delete avatar file when profile is deleted
@@ -69,12 +125,6 @@ class Profile(models.Model):
             self.avatar.delete(save=False)
         super().delete(*args, **kwargs)   
 
-    def followers_count(self):
-        return self.followers.count();
-
-    def following_count(self):
-        return self.following.count();    
-    
     def follow(self, profile):
         # follow another user
         if profile != self and not self.followers.filter(id=profile.id).exists():
@@ -93,4 +143,77 @@ class Profile(models.Model):
 
         # check if following a user 
         return self.followers.filter(id=profile.id).exists()
-            
+
+
+class Follow(models.Model):
+    """Through row of Profile.followers: `follower` follows `profile`"""
+    # Column names are the ones Django generated for the original auto-created table
+    profile = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name='follower_links',
+        db_column='from_profile_id'
+    )
+    follower = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name='following_links',
+        db_column='to_profile_id'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'api_profile_followers'
+        unique_together = ('profile', 'follower')
+        indexes = [
+            # Followers / following lists, keyset-paginated by follow time
+            models.Index(fields=['profile', 'created_at', 'id'], name='api_follow_profile_time_idx'),
+            models.Index(fields=['follower', 'created_at', 'id'], name='api_follow_follower_time_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """A post pushed into a viewer's home timeline when it was written"""
+    viewer = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # Copy of post.created_at so a page is one range scan on the index below
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('viewer', 'post')
+        indexes = [
+            models.Index(fields=['viewer', 'created_at', 'post'], name='api_timeline_viewer_idx'),
+        ]
+
+
+class Job(models.Model):
+    """A unit of background work, run by `manage.py run_jobs` (see jobs.py)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        # Out of attempts; kept for inspection and manual requeue
+        (DEAD, 'Dead'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The worker's "what is due" scan
+            models.Index(fields=['status', 'run_at'], name='api_job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
@@ -1,4 +1,192 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates to milliseconds, which breaks keyset ties
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
 
 class PostPagination(PageNumberPagination):
-    page_size= 5
\ No newline at end of file
+    page_size= 5
+
+
+class SuggestionPagination(PageNumberPagination):
+    # Pages over the cached, already ranked id list
+    page_size = 5
+
+
+def wants_page_numbers(request):
+    """Old clients opt back into page-number pagination with ?page= or ?pagination=page"""
+    params = request.query_params
+    return 'page' in params or params.get('pagination') == 'page'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique, composite ordering.
+
+    The cursor is an opaque token holding the ordering values of the last
+    row on the page, so every page is a range scan on an index matching
+    `ordering` - no COUNT(*) and no OFFSET, and rows inserted at the head
+    of the list never shift later pages.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 10
+    max_page_size = 50
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_window(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.page_window(queryset, request)])
+
+    def page_window(self, queryset, request):
+        """The unevaluated rows of the requested page, plus one"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(position))
+
+        # Fetch one extra row to know whether there is a next page
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        page = rows[:self.page_size]
+
+        self.next_position = self.get_position(page[-1]) if self.has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_position(self, obj):
+        return [getattr(obj, name.lstrip('-')) for name in self.ordering]
+
+    def position_filter(self, position):
+        """
+        Rows strictly after `position` in `ordering`, i.e. for ('-a', '-b'):
+        a < a0 OR (a = a0 AND b < b0)
+        """
+        condition = Q()
+        equal_prefix = {}
+        for name, value in zip(self.ordering, position):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal_prefix, **{f'{field}__{lookup}': value})
+            equal_prefix[field] = value
+        return condition
+
+    def encode_cursor(self, position):
+        payload = json.dumps(position, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                self.clean_value(self.get_field(queryset, name.lstrip('-')), value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def clean_value(self, field, value):
+        # Cursors come from the client: no NULLs (they can't be compared),
+        # and nothing outside the column's range, which the database rejects
+        value = field.to_python(value)
+        if value is None:
+            raise ValueError
+        field.run_validators(value)
+        return value
+
+    def get_field(self, queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+
+class CommentPagination(KeysetPagination):
+    # Threads read oldest first
+    ordering = ('created_at', 'id')
+    page_size = 20
+
+
+class PostCursorPagination(KeysetPagination):
+    # Post ids only grow, so new posts never shift a scroll in progress
+    ordering = ('-id',)
+    page_size = 5
+
+
+class FollowPagination(KeysetPagination):
+    # Follow rows, newest follow first
+    ordering = ('-created_at', '-id')
+    page_size = 10
+
+
+class TimelinePagination(KeysetPagination):
+    """Keyset pages of the home timeline, which merges two sources (see timeline.py)"""
+    ordering = ('-created_at', '-id')
+    page_size = 10
+
+    def paginate_timeline(self, queryset, viewer, request):
+        from .timeline import timeline_keys
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request, queryset)
+        keys = timeline_keys(viewer, position, self.page_size + 1)
+        self.has_next = len(keys) > self.page_size
+        keys = keys[:self.page_size]
+        self.next_position = list(keys[-1]) if self.has_next else None
+
+        posts = queryset.in_bulk([post_id for _, post_id in keys])
+        return [posts[post_id] for _, post_id in keys if post_id in posts]
+
+
+class UserSearchPagination(KeysetPagination):
+    # Exact matches, then prefix matches, then infix matches (see search.py)
+    ordering = ('match_rank', 'search_name', 'id')
+    page_size = 10
+    max_page_size = 25
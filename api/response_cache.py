@@ -0,0 +1,180 @@
+"""
+Cached responses for anonymous reads, invalidated by version bumps.
+
+Every cache entry key includes the current value of one or more version
+counters ("posts" for the post list, "profile:<user id>" for a profile).
+Writes never delete entries; the signals just bump the versions they
+affect, after the transaction commits, and entries under old versions
+are never read again and age out. This works the same with the
+local-memory cache and with a shared one, where it needs no key scans.
+
+Only anonymous requests are cached: authenticated responses carry
+per-viewer fields (is_liked, is_following). Entries keep the view's ETag,
+so a hit can still answer a conditional GET with 304.
+"""
+import hashlib
+import threading
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import urlencode
+from rest_framework.response import Response
+
+from . import etags, metrics
+
+VERSION_PREFIX = 'rc:v:'
+
+# Version of the username -> user id lookups behind profile keys
+USERNAMES = 'usernames'
+
+_local = threading.local()
+
+
+def _new_version():
+    # Never reuses a number after a version key is evicted
+    return time.time_ns()
+
+
+def get_versions(names):
+    keys = [VERSION_PREFIX + name for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _incr(names):
+    for name in names:
+        key = VERSION_PREFIX + name
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def _flush():
+    names, _local.pending = getattr(_local, 'pending', set()), set()
+    _incr(names)
+
+
+def bump(*names):
+    """
+    Invalidate everything cached under these versions once the current
+    transaction commits. Bumps are collected per thread, so a cascade
+    deleting hundreds of rows costs one increment per version.
+    """
+    if not hasattr(_local, 'pending'):
+        _local.pending = set()
+    _local.pending.update(names)
+    # Later callbacks find the set already flushed and do nothing
+    transaction.on_commit(_flush)
+
+
+def user_id_for(username):
+    """
+    User id behind a username, cached as long as responses are. The
+    entries sit under the USERNAMES version, which renames and account
+    deletions bump, so a name never keeps pointing at its old owner.
+    """
+    version, = get_versions([USERNAMES])
+    key = f'rc:uid:{version}:{hashlib.sha1(username.encode()).hexdigest()}'
+    user_id = cache.get(key)
+    if user_id is None:
+        user_id = User.objects.filter(username=username).values_list('id', flat=True).first()
+        if user_id is not None:
+            cache.set(key, user_id, settings.RESPONSE_CACHE_TTL)
+    return user_id
+
+
+def profile_versions(username):
+    """
+    Versions for a profile response, or None for an unknown username:
+    there is no profile version a later registration would bump, so
+    those responses are not cached at all.
+    """
+    user_id = user_id_for(username)
+    return None if user_id is None else [f'profile:{user_id}']
+
+
+def _plain(data):
+    # ReturnDict/ReturnList hold their serializer; cache plain containers
+    if isinstance(data, dict):
+        return {key: _plain(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_plain(value) for value in data]
+    return data
+
+
+def cache_key(name, request, versions):
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    raw = f'{request.scheme}://{request.get_host()}{request.path}?{query}|{versions}'
+    return f'rc:{name}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def cache_response(name, versions):
+    """
+    Cache a DRF function view's anonymous GET responses. `versions` maps
+    the view's (request, *args, **kwargs) to the version names the
+    response depends on, or to None to skip the cache for that request.
+    Goes under @api_view/@permission_classes, or @async_api_view for
+    async views.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method != 'GET' or request.user.is_authenticated:
+                    return await view(request, *args, **kwargs)
+
+                key, response = await sync_to_async(_lookup)(name, versions, request, args, kwargs)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    await sync_to_async(_store)(key, response)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            key, response = _lookup(name, versions, request, args, kwargs)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                _store(key, response)
+            return response
+        return wrapper
+    return decorator
+
+
+def _lookup(name, versions, request, args, kwargs):
+    """(cache key or None when not cacheable, cached response or None)"""
+    names = versions(request, *args, **kwargs)
+    if names is None:
+        return None, None
+    key = cache_key(name, request, get_versions(names))
+    cached = cache.get(key)
+    if cached is None:
+        metrics.incr(f'response_cache.miss.{name}')
+        return key, None
+
+    metrics.incr(f'response_cache.hit.{name}')
+    etag = cached['etag']
+    if etag and etags.matches(request, etag):
+        return key, etags.not_modified(etag)
+    response = Response(cached['data'])
+    return key, etags.tag(response, etag) if etag else response
+
+
+def _store(key, response):
+    if key is not None and response.status_code == 200:
+        cached = {'data': _plain(response.data), 'etag': response.get('ETag')}
+        cache.set(key, cached, settings.RESPONSE_CACHE_TTL)
@@ -0,0 +1,229 @@
+"""
+Full-text search over posts, and username search over profiles.
+
+PostgreSQL keeps a generated, weighted ``tsvector`` column on api_post with
+a GIN index, so the index follows every write on its own. SQLite (local
+development) uses an FTS5 table that is updated from the Post save/delete
+signals; ``manage.py rebuild_search_index`` resyncs it after bulk writes.
+Other databases fall back to an unindexed icontains scan.
+
+Both indexed backends match every search term as a prefix and order the
+results by relevance, best first.
+
+Usernames are searched through Profile.search_name, a lowercased copy
+of the username with a b-tree index (exact and prefix matches). On
+PostgreSQL a pg_trgm GIN index also serves infix matches.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+POST_TABLE = 'api_post'
+FTS_TABLE = 'api_post_fts'
+PROFILE_TABLE = 'api_profile'
+
+# Trigrams can't help shorter infix searches, so those only match prefixes
+MIN_INFIX_LENGTH = 3
+
+# Ignore absurdly long queries instead of building huge MATCH expressions
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def search_terms(query):
+    return _TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+class SQLiteSearchBackend:
+
+    def install(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(title, content, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        self.rebuild(schema_editor.connection)
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+    # search_name's own b-tree index covers exact and prefix matches
+    def install_profile_index(self, schema_editor):
+        pass
+
+    def uninstall_profile_index(self, schema_editor):
+        pass
+
+    def prefix_filter(self, field, prefix):
+        # LIKE is case-insensitive here and can't use the index; a range can
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+
+    def index_post(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)",
+                [post.pk, post.title, post.content],
+            )
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post_id])
+
+    def rebuild(self, conn=connection):
+        with conn.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, content) "
+                f"SELECT id, title, content FROM {POST_TABLE}"
+            )
+
+    def search(self, queryset, terms):
+        # "term"* is an FTS5 prefix query; space-separated terms are ANDed
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # bm25() is lower-is-better; negate it so every backend sorts DESC.
+        # Title hits weigh ten times more than content hits.
+        rank = RawSQL(
+            f"(SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = {POST_TABLE}.id)",
+            [match],
+            output_field=FloatField(),
+        )
+        matching_ids = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        return queryset.filter(id__in=matching_ids).annotate(search_rank=rank)
+
+
+class PostgresSearchBackend:
+
+    def install(self, schema_editor):
+        schema_editor.execute(
+            f"ALTER TABLE {POST_TABLE} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('english'::regconfig, coalesce(content, '')), 'B')"
+            f") STORED"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX {POST_TABLE}_search_vector_idx ON {POST_TABLE} USING GIN (search_vector)"
+        )
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute(f"DROP INDEX IF EXISTS {POST_TABLE}_search_vector_idx")
+        schema_editor.execute(f"ALTER TABLE {POST_TABLE} DROP COLUMN IF EXISTS search_vector")
+
+    def install_profile_index(self, schema_editor):
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            f"CREATE INDEX {PROFILE_TABLE}_search_name_trgm_idx "
+            f"ON {PROFILE_TABLE} USING GIN (search_name gin_trgm_ops)"
+        )
+
+    def uninstall_profile_index(self, schema_editor):
+        schema_editor.execute(f"DROP INDEX IF EXISTS {PROFILE_TABLE}_search_name_trgm_idx")
+
+    # Served by the varchar_pattern_ops index Django adds next to db_index
+    def prefix_filter(self, field, prefix):
+        return Q(**{f'{field}__startswith': prefix})
+
+    # The generated column is maintained by the database itself
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def rebuild(self, conn=connection):
+        pass
+
+    def search(self, queryset, terms):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        matches = RawSQL(
+            f"{POST_TABLE}.search_vector @@ to_tsquery('english', %s)",
+            [tsquery],
+            output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f"ts_rank_cd({POST_TABLE}.search_vector, to_tsquery('english', %s))",
+            [tsquery],
+            output_field=FloatField(),
+        )
+        return queryset.filter(matches).annotate(search_rank=rank)
+
+
+class FallbackSearchBackend:
+
+    def install(self, schema_editor):
+        pass
+
+    def uninstall(self, schema_editor):
+        pass
+
+    def install_profile_index(self, schema_editor):
+        pass
+
+    def uninstall_profile_index(self, schema_editor):
+        pass
+
+    def prefix_filter(self, field, prefix):
+        return Q(**{f'{field}__startswith': prefix})
+
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def rebuild(self, conn=connection):
+        pass
+
+    def search(self, queryset, terms):
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(content__icontains=term)
+        return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(conn=connection):
+    return _BACKENDS.get(conn.vendor, FallbackSearchBackend)()
+
+
+def search_posts(queryset, query):
+    """Filter `queryset` to posts matching `query`, most relevant first"""
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    return get_backend().search(queryset, terms).order_by('-search_rank', '-id')
+
+
+def normalize_username(username):
+    return (username or '').lower()
+
+
+def profile_name_filter(query, field='search_name'):
+    """Q matching profiles (or rows related to them via `field`) by username"""
+    query = normalize_username(query)
+    if len(query) < MIN_INFIX_LENGTH:
+        return get_backend().prefix_filter(field, query)
+    return Q(**{f'{field}__contains': query})
+
+
+def search_profiles(queryset, query):
+    """
+    Profiles whose username matches `query`, annotated with `match_rank`:
+    0 for an exact match, 1 for a prefix match and 2 for an infix match.
+    """
+    query = normalize_username(query)
+    rank = Case(
+        When(search_name=query, then=Value(0)),
+        When(search_name__startswith=query, then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+    return queryset.filter(profile_name_filter(query)).annotate(match_rank=rank)
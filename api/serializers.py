@@ -1,12 +1,50 @@
+import logging
 from django.conf import settings
 from rest_framework import serializers
-from .models import Post, Comment, Like , Profile
+from .models import Post, Comment, Like , Profile, Follow
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.models import User
-from django.contrib.auth import authenticate
-from .validators import validate_profile_image
-from django.db import transaction
+from .validators import validate_post_image, validate_profile_image
+from . import images
+from django.db import models, transaction
 
+logger = logging.getLogger(__name__)
+
+# Number of latest comments embedded in each feed post
+COMMENT_PREVIEW_SIZE = 3
+
+
+def viewer_following_ids(request):
+    """
+    Profile ids the requesting user follows, loaded with one query and
+    memoized on the request so every serializer in it shares the set.
+    """
+    http_request = getattr(request, '_request', request)
+    following_ids = getattr(http_request, '_following_profile_ids', None)
+    if following_ids is None:
+        following_ids = set(_following_ids(request.user))
+        http_request._following_profile_ids = following_ids
+    return following_ids
+
+
+async def aviewer_following_ids(request):
+    """viewer_following_ids() for async views, which must load it up front"""
+    http_request = getattr(request, '_request', request)
+    following_ids = getattr(http_request, '_following_profile_ids', None)
+    if following_ids is None:
+        following_ids = {profile_id async for profile_id in _following_ids(request.user)}
+        http_request._following_profile_ids = following_ids
+    return following_ids
+
+
+def _following_ids(user):
+    return Follow.objects.filter(follower__user=user).values_list('profile_id', flat=True)
+
+
+def liked_post_ids(user, post_ids):
+    """Which of `post_ids` `user` has liked, as an unevaluated id query"""
+    return Like.objects.filter(user=user, post_id__in=post_ids).values_list("post_id", flat=True)
 
 #  use for user validate by username or email both of them and it's store both jwt tokens
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -18,31 +56,14 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         if not identifier or not password:
             raise serializers.ValidationError("Username/email and password required")
 
-        # Find user by email OR username
-        user = (
-            User.objects.filter(email=identifier).first()
-            or User.objects.filter(username=identifier).first()
-        )
-
-        if not user:
-            raise serializers.ValidationError("Invalid credentials")
-
-        # Authenticate properly
-        user = authenticate(
-            request=self.context.get("request"),
-            username=user.username,
-            password=password,
-        )
-
-        if not user:
+        # EmailOrUsernameModelBackend resolves username or email in the one
+        # authenticate() call the parent makes, so the password is hashed once
+        try:
+            data = super().validate(attrs)
+        except AuthenticationFailed:
             raise serializers.ValidationError("Invalid credentials")
 
-        data = super().validate({
-            "username": user.username,
-            "password": password
-        })
-
-        data["username"] = user.username
+        data["username"] = self.user.username
         return data
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -52,19 +73,36 @@ class CommentSerializer(serializers.ModelSerializer):
         model = Comment
         fields = '__all__'   
 
+class PostListSerializer(serializers.ListSerializer):
+    """Resolve the viewer's likes for a whole page of posts in one query"""
+
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+
+        request = self.context.get("request")
+        # Async views pass the set in, already loaded
+        if request and request.user.is_authenticated and "liked_post_ids" not in self.context:
+            self.context["liked_post_ids"] = set(
+                liked_post_ids(request.user, [post.id for post in posts])
+            )
+
+        return super().to_representation(posts)
+
 class PostsSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     user_name = serializers.CharField(source="user.username", read_only=True)
-    image = serializers.ImageField(required=False)
+    image = serializers.ImageField(required=False, validators=[validate_post_image])
+    image_variants = serializers.SerializerMethodField()
     user_avatar = serializers.SerializerMethodField()
+    user_avatar_variants = serializers.SerializerMethodField()
 
-    likes_count = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
-    comments = CommentSerializer(many=True, read_only= True)
+    comments = serializers.SerializerMethodField()
     class Meta:
         model = Post
         fields = '__all__'
-        read_only_fields = ('created_at', "user")
+        read_only_fields = ('created_at', "user", "likes_count", "comments_count")
+        list_serializer_class = PostListSerializer
 
     def get_user_avatar(self, obj):
         profile = obj.user.profile
@@ -73,15 +111,29 @@ class PostsSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(profile.avatar.url)
         return None    
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()    
-    
+    def get_image_variants(self, obj):
+        return images.variant_urls(obj.image, obj.image_variants, self.context.get('request'))
+
+    def get_user_avatar_variants(self, obj):
+        profile = obj.user.profile
+        return images.variant_urls(profile.avatar, profile.avatar_variants, self.context.get('request'))
+
     def get_is_liked(self, obj):
         request = self.context.get("request")
         if request and request.user.is_authenticated:
+            liked_post_ids = self.context.get("liked_post_ids")
+            if liked_post_ids is not None:
+                return obj.id in liked_post_ids
             return obj.likes.filter(user=request.user).exists()
         return False
     
+    def get_comments(self, obj):
+        """Latest few comments, oldest first; the full thread is paginated separately"""
+        preview = getattr(obj, "comment_preview", None)
+        if preview is None:
+            preview = obj.comments.select_related("user").order_by("-created_at", "-id")[:COMMENT_PREVIEW_SIZE]
+        return CommentSerializer(reversed(list(preview)), many=True).data
+
     def get_image(self, obj):
         request = self.context.get("request")
         if obj.image:
@@ -105,9 +157,12 @@ class ProfileSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     username = serializers.CharField(source='user.username', read_only=True)
     is_following = serializers.SerializerMethodField()
-    followers_count = serializers.SerializerMethodField()
+    followers_count = serializers.IntegerField(read_only=True)
+    following_count = serializers.IntegerField(read_only=True)
+    posts_count = serializers.IntegerField(read_only=True)
     joined_date = serializers.DateTimeField(source='user.date_joined', read_only=True)
-    avatar = serializers.ImageField(required=False, allow_null=True)
+    avatar = serializers.ImageField(required=False, allow_null=True, validators=[validate_profile_image])
+    avatar_variants = serializers.SerializerMethodField()
     bio = serializers.CharField(required=False, allow_blank=True)  
     email = serializers.EmailField(source='user.email', read_only=True)  
     
@@ -119,13 +174,19 @@ class ProfileSerializer(serializers.ModelSerializer):
             'user_id',
             'username',
             'avatar',
+            'avatar_variants',
             'email',  
             'bio',   
             'joined_date',
             'is_following',
             'followers_count',
+            'following_count',
+            'posts_count',
         ]
 
+    def get_avatar_variants(self, obj):
+        return images.variant_urls(obj.avatar, obj.avatar_variants, self.context.get('request'))
+
     def get_avatar(self, obj):
         try:
             if obj.avatar:
@@ -147,20 +208,11 @@ class ProfileSerializer(serializers.ModelSerializer):
             if not request or not request.user.is_authenticated:
                 return False
 
-            current_user = request.user
-            current_profile = current_user.profile
-            return obj.followers.filter(id=current_profile.id).exists()
-            
-        except Exception as e:
-            print(f"ERROR in get_is_following: {e}")
-            return False
+            return obj.id in viewer_following_ids(request)
 
-    def get_followers_count(self, obj):
-        """Get number of followers for this profile"""
-        try:
-            return obj.followers.count()
-        except:
-            return 0
+        except Exception:
+            logger.exception("Could not resolve is_following for profile %s", obj.pk)
+            return False
 class UserFollowSerializer(serializers.ModelSerializer):
     profile = ProfileSerializer(source='profile', read_only=True)
     
@@ -173,7 +225,18 @@ class FollowActionSerializer(serializers.Serializer):
     action = serializers.ChoiceField(
         choices=['follow', 'unfollow'],
         required=True
-    )       
+    )
+
+class FollowBatchSerializer(serializers.Serializer):
+    actions = FollowActionSerializer(many=True, allow_empty=False)
+
+    def validate_actions(self, actions):
+        if len(actions) > settings.BATCH_MAX_IDS:
+            raise serializers.ValidationError(f"At most {settings.BATCH_MAX_IDS} actions per request")
+        user_ids = [action['user_id'] for action in actions]
+        if len(set(user_ids)) != len(user_ids):
+            raise serializers.ValidationError("Each user_id can appear only once")
+        return actions
 
 class UserSerializer(serializers.ModelSerializer):
     profile = ProfileSerializer( read_only=True)
@@ -1,9 +1,238 @@
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import Profile, Post, Like, Comment, Follow
+from . import images, response_cache, search, suggestions, timeline
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.utils import timezone
+from django.db.models import F, Q, QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 
 @receiver(post_save, sender=User)
-def create_profile(sender, instance, created, **kwargs):
+def create_profile(sender, instance, created, update_fields=None, **kwargs):
     if created and not hasattr(instance, 'profile'):
         Profile.objects.create(user=instance)
+    elif not created and (update_fields is None or 'username' in update_fields):
+        # Keep the search column in step with renames
+        Profile.objects.filter(user=instance).update(
+            search_name=search.normalize_username(instance.username),
+            updated_at=timezone.now(),
+        )
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, created, **kwargs):
+    search.get_backend().index_post(instance)
+    if created:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.get_backend().remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def post_image_changed(sender, instance, **kwargs):
+    images.sync_variants(instance, 'image', 'image_variants')
+
+
+@receiver(post_save, sender=Profile)
+def avatar_changed(sender, instance, **kwargs):
+    images.sync_variants(instance, 'avatar', 'avatar_variants')
+
+
+@receiver(post_delete, sender=Post)
+def post_image_deleted(sender, instance, **kwargs):
+    images.delete_variants(instance.image_variants, storage=instance.image.storage)
+
+
+@receiver(post_delete, sender=Profile)
+def avatar_deleted(sender, instance, **kwargs):
+    images.delete_variants(instance.avatar_variants, storage=instance.avatar.storage)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        Profile.objects.filter(user_id=instance.user_id).update(posts_count=F('posts_count') + 1, updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, origin=None, **kwargs):
+    # Nothing to update when the author's account (and profile) is going away
+    if isinstance(origin, User) and origin.pk == instance.user_id:
+        return
+    Profile.objects.filter(user_id=instance.user_id).update(posts_count=F('posts_count') - 1, updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Remember the account's posts so the cascade can skip their counters
+    instance._deleting_post_ids = set(instance.posts.values_list('id', flat=True))
+
+
+def _deleting_post(origin, post_id):
+    # Skip counter updates when the post itself is being deleted (cascade)
+    if isinstance(origin, Post):
+        return origin.pk == post_id
+    if isinstance(origin, User):
+        return post_id in getattr(origin, '_deleting_post_ids', ())
+    return isinstance(origin, QuerySet) and origin.model is Post
+
+
+def _adjust_post_counter(post_id, field, delta):
+    Post.objects.filter(pk=post_id).update(**{field: F(field) + delta}, updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        _adjust_post_counter(instance.post_id, 'likes_count', 1)
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleting_post(origin, instance.post_id):
+        _adjust_post_counter(instance.post_id, 'likes_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        _adjust_post_counter(instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleting_post(origin, instance.post_id):
+        _adjust_post_counter(instance.post_id, 'comments_count', -1)
+
+
+def _update_follow_counters(instance, reverse, pks, delta):
+    """`instance` gained/lost len(pks) follow links, each profile in `pks` one"""
+    # reverse=True means instance.following was changed, i.e. instance is the follower
+    own, other = ('following_count', 'followers_count') if reverse else ('followers_count', 'following_count')
+    if pks:
+        Profile.objects.filter(pk=instance.pk).update(**{own: F(own) + len(pks) * delta}, updated_at=timezone.now())
+        Profile.objects.filter(pk__in=pks).update(**{other: F(other) + delta}, updated_at=timezone.now())
+
+
+def _linked_pks(instance, reverse, pk_set=None):
+    """Profiles currently linked to `instance` (optionally limited to pk_set)"""
+    if reverse:
+        links = Follow.objects.filter(follower=instance)
+        other_side = 'profile_id'
+    else:
+        links = Follow.objects.filter(profile=instance)
+        other_side = 'follower_id'
+    if pk_set is not None:
+        links = links.filter(**{f'{other_side}__in': pk_set})
+    return list(links.values_list(other_side, flat=True))
+
+
+@receiver(m2m_changed, sender=Follow)
+def follows_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # The follower's suggestions no longer match who they follow
+        if reverse:
+            suggestions.invalidate([instance.pk])
+        elif pk_set:
+            suggestions.invalidate(pk_set)
+
+    # add() reports only the rows it actually inserted, but remove() reports
+    # whatever it was asked to remove, so removals are counted before the delete
+    if action == 'post_add':
+        _update_follow_counters(instance, reverse, pk_set, 1)
+        _backfill_timelines(instance, reverse, pk_set)
+        if pk_set:
+            _bump_profiles([instance.pk, *pk_set])
+    elif action in ('pre_remove', 'pre_clear'):
+        pks = _linked_pks(instance, reverse, pk_set if action == 'pre_remove' else None)
+        _update_follow_counters(instance, reverse, pks, -1)
+        if pks:
+            _bump_profiles([instance.pk, *pks])
+        if reverse:
+            timeline.prune([instance.pk], pks)
+        else:
+            timeline.prune(pks, [instance.pk])
+
+
+def _backfill_timelines(instance, reverse, pk_set):
+    if not pk_set:
+        return
+    if reverse:
+        for author in Profile.objects.filter(pk__in=pk_set):
+            timeline.backfill([instance.pk], author)
+    else:
+        timeline.backfill(list(pk_set), instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    # Direct Follow.objects.create(); the m2m managers don't send post_save
+    if created:
+        Profile.objects.filter(pk=instance.profile_id).update(followers_count=F('followers_count') + 1, updated_at=timezone.now())
+        Profile.objects.filter(pk=instance.follower_id).update(following_count=F('following_count') + 1, updated_at=timezone.now())
+        timeline.backfill([instance.follower_id], instance.profile)
+        suggestions.invalidate([instance.follower_id])
+        _bump_profiles([instance.profile_id, instance.follower_id])
+
+
+@receiver(pre_delete, sender=Profile)
+def profile_deleted(sender, instance, **kwargs):
+    # The cascade deletes this profile's follow rows without m2m signals
+    Profile.objects.filter(
+        pk__in=Follow.objects.filter(follower=instance).values('profile_id')
+    ).update(followers_count=F('followers_count') - 1, updated_at=timezone.now())
+    Profile.objects.filter(
+        pk__in=Follow.objects.filter(profile=instance).values('follower_id')
+    ).update(following_count=F('following_count') - 1, updated_at=timezone.now())
+    linked_users = Profile.objects.filter(
+        Q(pk__in=Follow.objects.filter(follower=instance).values('profile_id'))
+        | Q(pk__in=Follow.objects.filter(profile=instance).values('follower_id'))
+    ).values_list('user_id', flat=True)
+    response_cache.bump(*(f'profile:{user_id}' for user_id in linked_users))
+
+
+# Anonymous response cache (see response_cache.py): bump the versions a
+# write makes stale instead of deleting cached responses
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    response_cache.bump('posts', f'profile:{instance.user_id}')
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def post_activity_changed(sender, instance, **kwargs):
+    response_cache.bump('posts')
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    # Posts embed the author's avatar
+    response_cache.bump('posts', f'profile:{instance.user_id}')
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Posts and profiles embed the username
+    if not created:
+        response_cache.bump('posts', f'profile:{instance.pk}')
+        if update_fields is None or 'username' in update_fields:
+            # The old name may now be free for someone else
+            response_cache.bump(response_cache.USERNAMES)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    response_cache.bump(response_cache.USERNAMES)
+
+
+def _bump_profiles(profile_pks):
+    # Profile versions are keyed by user id, which is what the views look up
+    user_ids = Profile.objects.filter(pk__in=profile_pks).values_list('user_id', flat=True)
+    response_cache.bump(*(f'profile:{user_id}' for user_id in user_ids))
@@ -0,0 +1,62 @@
+"""
+Follow suggestions ranked by mutual follows.
+
+Candidates are the profiles followed by the people a user follows
+(second-degree neighbours in Profile.followers), ranked by how many of
+those people follow them. The ranked id list is cached per user for
+SUGGESTIONS_CACHE_TTL seconds and dropped as soon as the user follows
+or unfollows someone.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Follow, Profile
+
+MAX_SUGGESTIONS = 50
+
+
+def cache_key(profile_id):
+    return f'suggestions:{profile_id}'
+
+
+def invalidate(profile_ids):
+    cache.delete_many([cache_key(pk) for pk in profile_ids])
+
+
+def compute_suggestions(profile):
+    """[(profile_id, mutual_count)], best first"""
+    following = Follow.objects.filter(follower=profile).values('profile_id')
+
+    ranked = list(
+        Follow.objects.filter(follower_id__in=following)
+        .exclude(profile=profile)
+        .exclude(profile_id__in=following)
+        .values('profile_id')
+        .annotate(mutual=Count('id'))
+        .order_by('-mutual', 'profile_id')
+        .values_list('profile_id', 'mutual')[:MAX_SUGGESTIONS]
+    )
+
+    # New users have no second-degree network yet; top up with popular profiles
+    if len(ranked) < MAX_SUGGESTIONS:
+        seen = [profile_id for profile_id, _ in ranked]
+        popular = (
+            Profile.objects.exclude(pk=profile.pk)
+            .exclude(pk__in=following)
+            .exclude(pk__in=seen)
+            .order_by('-followers_count', 'id')
+            .values_list('id', flat=True)[:MAX_SUGGESTIONS - len(ranked)]
+        )
+        ranked += [(profile_id, 0) for profile_id in popular]
+
+    return ranked
+
+
+def get_suggestions(profile):
+    key = cache_key(profile.pk)
+    suggestions = cache.get(key)
+    if suggestions is None:
+        suggestions = compute_suggestions(profile)
+        cache.set(key, suggestions, settings.SUGGESTIONS_CACHE_TTL)
+    return suggestions
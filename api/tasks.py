@@ -0,0 +1,40 @@
+"""Background tasks run by the job queue (see jobs.py)"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.crypto import get_random_string
+
+from .jobs import task
+
+
+@task('send_email')
+def send_email(subject, message, recipient_list, from_email=None):
+    from django.core.mail import send_mail
+
+    # Raise on failure so the queue retries
+    send_mail(subject, message, from_email or settings.DEFAULT_FROM_EMAIL, recipient_list, fail_silently=False)
+
+
+@task('reset_password')
+def reset_password(user_id):
+    """
+    Mail a new random password, then set it. Generated here rather than in
+    the view so the plain-text password never sits in the jobs table.
+
+    The email goes out first: if it fails, the password is left alone and
+    the retry starts over, so a job that ends up dead never locks the user
+    out with a password they were not sent.
+    """
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return
+
+    new_password = get_random_string(8)
+    send_email(
+        'Password reset',
+        f"Your new password is {new_password}",
+        [user.email],
+        from_email='noreply@yourapp.com',
+    )
+
+    user.set_password(new_password)
+    user.save(update_fields=['password'])
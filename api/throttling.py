@@ -0,0 +1,152 @@
+"""
+Sliding-window throttles for the endpoints that hash passwords.
+
+Each scope allows N requests per period, using the DRF rate strings in
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] ('5/min' is 5 requests in any
+rolling minute). Requests are counted per fixed window, and the previous
+window's count is weighted by how much of it still overlaps the rolling
+period, so a burst at a window boundary can't get through twice.
+
+Counters live in the Django cache, so they are shared by every worker
+when the cache is. They only move through cache.add() and cache.incr(),
+which are atomic in every backend (INCR on Redis): each of several
+concurrent requests gets its own count, and a parallel burst can't all
+read the same remaining allowance.
+
+DRF checks throttles in APIView.initial(), before the view body runs, so
+a rejected request costs a few cache round trips - never a PBKDF2 hash.
+The 429 carries Retry-After, and every rejection bumps the
+throttle.rejected.<scope> counter in metrics.py.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """'5/min' -> (5 requests, per 60 seconds)"""
+    count, period = rate.split('/')
+    return int(count), _PERIODS[period[0]]
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    scope = None
+    cache_format = 'throttle:%(scope)s:%(ident)s:%(window)d'
+
+    def get_ident_key(self, request):
+        """What to count requests against; None skips the throttle"""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_key(request)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if ident is None or rate is None:
+            return True
+
+        limit, period = parse_rate(rate)
+        now = time.time()
+        window, elapsed = divmod(now, period)
+        elapsed /= period
+        key = self.cache_format % {'scope': self.scope, 'ident': ident, 'window': window}
+        previous_key = self.cache_format % {'scope': self.scope, 'ident': ident, 'window': window - 1}
+
+        previous = cache.get(previous_key, 0)
+        # The next window still reads this one, so it outlives its period
+        cache.add(key, 0, 2 * period)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.add(key, 1, 2 * period)
+            count = 1
+
+        allowed = previous * (1 - elapsed) + count <= limit
+        if not allowed:
+            # Rejected requests don't use up the allowance
+            cache.decr(key)
+            self.wait_seconds = self.seconds_until_allowed(previous, count, elapsed, limit, period)
+            metrics.incr(f'throttle.rejected.{self.scope}')
+        return allowed
+
+    @staticmethod
+    def seconds_until_allowed(previous, count, elapsed, limit, period):
+        if count <= limit:
+            # Only the previous window's share is in the way; wait for it to slide out
+            return (1 - (limit - count) / previous - elapsed) * period
+        # This window is full: wait for the next one, where it counts as the previous
+        settled = count - 1
+        return (1 - elapsed + max(0, 1 - (limit - 1) / settled)) * period
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+def _hashed(value):
+    # User input isn't a safe cache key
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+class IPThrottle(SlidingWindowThrottle):
+    """
+    Per client address. X-Forwarded-For is only read past the
+    REST_FRAMEWORK['NUM_PROXIES'] trusted proxies; otherwise a client
+    could send a new value with every request and get a fresh bucket.
+    """
+
+    def get_ident_key(self, request):
+        if api_settings.NUM_PROXIES is None:
+            ident = request.META.get('REMOTE_ADDR', '')
+        else:
+            ident = self.get_ident(request)
+        return _hashed(ident)
+
+
+class IdentifierThrottle(SlidingWindowThrottle):
+    """Per login name, so one account can't be stuffed from many IPs"""
+    fields = ('identifier', 'username', 'email')
+
+    def get_ident_key(self, request):
+        for field in self.fields:
+            value = request.data.get(field)
+            if isinstance(value, str) and value.strip():
+                return _hashed(value.strip().lower())
+        return None
+
+
+class UserThrottle(SlidingWindowThrottle):
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class LoginIPThrottle(IPThrottle):
+    scope = 'login_ip'
+
+
+class LoginIdentifierThrottle(IdentifierThrottle):
+    scope = 'login_identifier'
+
+
+class RegisterIPThrottle(IPThrottle):
+    scope = 'register_ip'
+
+
+class PasswordIPThrottle(IPThrottle):
+    scope = 'password_ip'
+
+
+class PasswordUserThrottle(UserThrottle):
+    scope = 'password_user'
+
+
+LOGIN_THROTTLES = [LoginIPThrottle, LoginIdentifierThrottle]
+REGISTER_THROTTLES = [RegisterIPThrottle]
+PASSWORD_THROTTLES = [PasswordIPThrottle, PasswordUserThrottle]
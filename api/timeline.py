@@ -0,0 +1,108 @@
+"""
+Home timeline: posts from the profiles a viewer follows, plus their own.
+
+New posts are fanned out on write into TimelineEntry rows, one per
+follower, in batches. Authors with more than TIMELINE_FANOUT_LIMIT
+followers are not fanned out; their posts are pulled at read time and
+merged with the viewer's materialized entries instead.
+"""
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Follow, Post, Profile, TimelineEntry
+
+FANOUT_BATCH_SIZE = 1000
+
+# Recent posts copied into a timeline when the viewer starts following someone
+BACKFILL_SIZE = 100
+
+
+def is_pull_author(profile):
+    return profile.followers_count > settings.TIMELINE_FANOUT_LIMIT
+
+
+def _entries(viewer_ids, post):
+    return [
+        TimelineEntry(viewer_id=viewer_id, post_id=post.pk, created_at=post.created_at)
+        for viewer_id in viewer_ids
+    ]
+
+
+def fan_out_post(post):
+    """Push a new post into its author's and (unless pulled) its followers' timelines"""
+    author = Profile.objects.get(user_id=post.user_id)
+    TimelineEntry.objects.bulk_create(_entries([author.pk], post), ignore_conflicts=True)
+
+    if is_pull_author(author):
+        return
+
+    follower_ids = Follow.objects.filter(profile=author).values_list('follower_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=FANOUT_BATCH_SIZE):
+        batch.append(follower_id)
+        if len(batch) == FANOUT_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(_entries(batch, post), ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(_entries(batch, post), ignore_conflicts=True)
+
+
+def backfill(viewer_ids, author):
+    """Copy an author's recent posts into the timelines of new followers"""
+    if not viewer_ids or is_pull_author(author):
+        return
+
+    recent = Post.objects.filter(user_id=author.user_id).only('id', 'created_at').order_by('-id')[:BACKFILL_SIZE]
+    entries = [entry for post in recent for entry in _entries(viewer_ids, post)]
+    TimelineEntry.objects.bulk_create(entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+
+
+def backfill_authors(viewer_id, authors):
+    """backfill() for one viewer who started following many authors at once"""
+    user_ids = [author.user_id for author in authors if not is_pull_author(author)]
+    if not user_ids:
+        return
+
+    # The latest BACKFILL_SIZE posts of every author, in one query
+    recent = Post.objects.filter(user_id__in=user_ids).annotate(
+        rank=Window(RowNumber(), partition_by=F('user_id'), order_by=F('id').desc())
+    ).filter(rank__lte=BACKFILL_SIZE).only('id', 'created_at')
+    entries = [entry for post in recent for entry in _entries([viewer_id], post)]
+    TimelineEntry.objects.bulk_create(entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+
+
+def prune(viewer_ids, author_ids):
+    """Drop the authors' posts from the viewers' timelines after an unfollow"""
+    if viewer_ids and author_ids:
+        TimelineEntry.objects.filter(
+            viewer_id__in=viewer_ids,
+            post__user__profile__in=author_ids,
+        ).delete()
+
+
+def timeline_keys(viewer, position=None, limit=10):
+    """
+    (created_at, post_id) pairs of the viewer's home timeline, newest
+    first, strictly after `position`.
+    """
+    entries = TimelineEntry.objects.filter(viewer=viewer)
+    if position is not None:
+        created_at, post_id = position
+        entries = entries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lt=post_id))
+    keys = list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:limit])
+
+    pulled_user_ids = list(
+        Follow.objects.filter(
+            follower=viewer,
+            profile__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('profile__user_id', flat=True)
+    )
+    if pulled_user_ids:
+        posts = Post.objects.filter(user_id__in=pulled_user_ids)
+        if position is not None:
+            posts = posts.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id))
+        keys += posts.order_by('-created_at', '-id').values_list('created_at', 'id')[:limit]
+        keys = sorted(set(keys), reverse=True)[:limit]
+
+    return keys
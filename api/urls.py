@@ -1,20 +1,30 @@
+from django.conf import settings
 from django.urls import path
-from .views import post_api, post_detail, login_api, RegisterView, current_user, my_post, google_login, forget_password, LikePostView, CommentCreateView, suggestions_to_follow, follow_user, get_followers,get_following, user_profile, delete_account, search_users, change_password, change_password_without_old, update_profile
+from .views import post_api, post_detail, home_feed, login_api, RegisterView, current_user, my_post, google_login, forget_password, LikePostView, CommentCreateView, suggestions_to_follow, follow_user, get_followers,get_following, user_profile, delete_account, search_users, change_password, change_password_without_old, update_profile, service_metrics, readiness, likes_state, profiles_batch, follow_batch
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer
+from .throttling import LOGIN_THROTTLES
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
+
+if settings.ASYNC_VIEWS:
+    # Under ASGI the read-heavy endpoints run on the event loop
+    from .async_views import post_api, get_followers, get_following, user_profile, search_users
+
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = LOGIN_THROTTLES
 
 urlpatterns = [
    path('Post/', post_api, name='Post_api'),
+   path('Post/likes-state', likes_state, name='Post_likes_state'),
    path('Post/<int:post_id>/', post_detail, name='Post_detail'),
    path('Post/<int:post_id>/like/', LikePostView, name='Post_likes'),
    path('Post/<int:post_id>/comment/', CommentCreateView, name='Post_comments'),
    path('my-posts/', my_post, name='my_posts'),
+   path('feed/', home_feed, name='home_feed'),
    path('login/', login_api, name='login_api'),
    path('register/', RegisterView, name='register'),
    path('current_user/', current_user, name='current_user'),
@@ -24,12 +34,16 @@ urlpatterns = [
    path('google-login/', google_login, name='google-login'),
    path('suggestions/', suggestions_to_follow, name='suggestions'),
    path('follow/', follow_user, name='follow_user'),
+   path('follow/batch', follow_batch, name='follow_batch'),
    path('followers/', get_followers, name='get_followers'),
    path('following/', get_following, name='get_following'),
    path('profile/<str:username>/', user_profile, name='user_profile'),
+   path('profiles', profiles_batch, name='profiles_batch'),
    path('delete-account/', delete_account, name='delete_account' ),
    path('users/search/', search_users, name='search_user'),
    path('change-password/', change_password, name='change_password'),
    path('change-password-without-old/', change_password_without_old, name='change_password_without_old'),
    path('update-profile/', update_profile, name='update_profile'),
+   path('metrics/', service_metrics, name='service_metrics'),
+   path('health/ready', readiness, name='readiness'),
 ]
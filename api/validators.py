@@ -1,73 +1,119 @@
 import os
+import warnings
 from django.core.exceptions import ValidationError
-from PIL import Image
-import magic
-
-def validate_image_size(image):
-    """Validate image file size"""
-    max_size = 5 * 1024 * 1024  # 5MB
-    
-    if image.size > max_size:
-        raise ValidationError(f'Image size should not exceed {max_size/1024/1024}MB.')
-
-def validate_image_type(image):
-    """Validate image file type using magic numbers"""
-    allowed_mime_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
-    allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
-    
-    # Get file extension
-    ext = os.path.splitext(image.name)[1].lower()
-    if ext not in allowed_extensions:
-        raise ValidationError(f'Unsupported file extension. Allowed: {", ".join(allowed_extensions)}')
-    
-    # Check MIME type using python-magic
-    try:
-        mime = magic.from_buffer(image.read(1024), mime=True)
-        if mime not in allowed_mime_types:
-            raise ValidationError(f'Unsupported file type. Allowed: {", ".join([m.split("/")[1] for m in allowed_mime_types])}')
-    except Exception:
-        # If magic fails, check extension
-        if ext not in allowed_extensions:
+from django.utils.deconstruct import deconstructible
+
+MIME_TYPES = {
+    'image/jpeg': ('.jpg', '.jpeg'),
+    'image/png': ('.png',),
+    'image/gif': ('.gif',),
+    'image/webp': ('.webp',),
+}
+
+# libmagic only needs the first couple of KB to identify a format
+SNIFF_SIZE = 2048
+
+
+@deconstructible
+class ImageValidator:
+    """
+    Validate an uploaded image in one pass over its header.
+
+    The file is sniffed once with libmagic, and its dimensions come from
+    the image header Pillow already parsed in ImageField (or from a lazy
+    Image.open, which reads no pixel data). Width x height is checked
+    against `max_pixels` before anything is decoded, so decompression
+    bombs are rejected up front. Pass None to disable a check.
+    """
+
+    def __init__(
+        self,
+        max_size=5 * 1024 * 1024,
+        mime_types=tuple(MIME_TYPES),
+        min_dimensions=(100, 100),
+        max_dimensions=(5000, 5000),
+        max_pixels=25_000_000,
+        aspect_ratio=None,
+        aspect_tolerance=0.1,
+    ):
+        self.max_size = max_size
+        self.mime_types = tuple(mime_types)
+        self.min_dimensions = min_dimensions
+        self.max_dimensions = max_dimensions
+        self.max_pixels = max_pixels
+        self.aspect_ratio = aspect_ratio
+        self.aspect_tolerance = aspect_tolerance
+
+    def __call__(self, image):
+        self.check_size(image)
+        self.check_type(image)
+        width, height = self.read_dimensions(image)
+        self.check_dimensions(width, height)
+
+    def __eq__(self, other):
+        return isinstance(other, ImageValidator) and vars(self) == vars(other)
+
+    def check_size(self, image):
+        if self.max_size is not None and image.size > self.max_size:
+            raise ValidationError(f'Image size should not exceed {self.max_size/1024/1024}MB.')
+
+    def check_type(self, image):
+        extensions = [ext for mime in self.mime_types for ext in MIME_TYPES[mime]]
+        ext = os.path.splitext(image.name)[1].lower()
+        if ext not in extensions:
+            raise ValidationError(f'Unsupported file extension. Allowed: {", ".join(extensions)}')
+
+        # libmagic and Pillow load on the first upload, not at startup
+        import magic
+
+        image.seek(0)
+        mime = magic.from_buffer(image.read(SNIFF_SIZE), mime=True)
+        image.seek(0)
+        if mime not in self.mime_types:
+            allowed = ", ".join(m.split("/")[1] for m in self.mime_types)
+            raise ValidationError(f'Unsupported file type. Allowed: {allowed}')
+
+    def read_dimensions(self, image):
+        # forms.ImageField leaves the header it parsed on the file
+        parsed = getattr(image, 'image', None)
+        if parsed is not None:
+            return parsed.size
+
+        from PIL import Image, UnidentifiedImageError
+
+        try:
+            # The pixel limit is enforced below, without decoding anything
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                with Image.open(image) as img:
+                    return img.size
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
             raise ValidationError('Invalid image file.')
+        finally:
+            image.seek(0)
+
+    def check_dimensions(self, width, height):
+        if self.max_pixels is not None and width * height > self.max_pixels:
+            raise ValidationError(f'Image must not exceed {self.max_pixels:,} pixels.')
 
-def validate_image_dimensions(image):
-    """Validate image dimensions"""
-    min_width, min_height = 100, 100
-    max_width, max_height = 5000, 5000
-    
-    try:
-        with Image.open(image) as img:
-            width, height = img.size
-            
+        if self.min_dimensions is not None:
+            min_width, min_height = self.min_dimensions
             if width < min_width or height < min_height:
                 raise ValidationError(f'Image must be at least {min_width}x{min_height} pixels.')
-            
+
+        if self.max_dimensions is not None:
+            max_width, max_height = self.max_dimensions
             if width > max_width or height > max_height:
                 raise ValidationError(f'Image must be less than {max_width}x{max_height} pixels.')
-            
-            # Reset file pointer
-            image.seek(0)
-    except Exception as e:
-        raise ValidationError('Could not read image dimensions.')
-
-def validate_image_aspect_ratio(image, width_ratio=1, height_ratio=1, tolerance=0.1):
-    """Validate image aspect ratio"""
-    try:
-        with Image.open(image) as img:
-            width, height = img.size
-            expected_ratio = width_ratio / height_ratio
-            actual_ratio = width / height
-            
-            if abs(actual_ratio - expected_ratio) > tolerance:
+
+        if self.aspect_ratio is not None:
+            width_ratio, height_ratio = self.aspect_ratio
+            if abs(width / height - width_ratio / height_ratio) > self.aspect_tolerance:
                 raise ValidationError(f'Image must have {width_ratio}:{height_ratio} aspect ratio.')
-            
-            image.seek(0)
-    except Exception:
-        pass  # Skip aspect validation if image can't be opened
-
-def validate_profile_image(image):
-    """Complete validation for profile images"""
-    validate_image_size(image)
-    validate_image_type(image)
-    validate_image_dimensions(image)
-    validate_image_aspect_ratio(image, 1, 1)  # Square aspect ratio
\ No newline at end of file
+
+
+# Avatars were meant to be square, but the old check swallowed its own
+# error and never rejected anything; keep accepting any ratio for now
+validate_profile_image = ImageValidator()
+
+validate_post_image = ImageValidator(min_dimensions=None)
@@ -1,28 +1,32 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, throttle_classes
 from rest_framework.response import Response
-from .models import Post, Like, Comment, Profile
-from django.db import models
+from .models import Post, Like, Comment, Profile, Follow
 from django.contrib.auth import authenticate
-from .serializers import PostsSerializer , CommentSerializer, UserSerializer,  RegisterSerializer, ProfileSerializer, UserFollowSerializer, FollowActionSerializer
+from .serializers import COMMENT_PREVIEW_SIZE, PostsSerializer , CommentSerializer, UserSerializer,  RegisterSerializer, ProfileSerializer, UserFollowSerializer, FollowActionSerializer, FollowBatchSerializer, liked_post_ids
 from rest_framework import status, generics
-from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.authtoken.models import Token
-from django.db.models import Q
+from django.db.models import F, Q, Prefetch
 from django.contrib.auth.models import User
-from .pagination import PostPagination
-from django.core.mail import send_mail
-from django.utils.crypto import get_random_string
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
+from .pagination import PostPagination, PostCursorPagination, CommentPagination, FollowPagination, TimelinePagination, SuggestionPagination, UserSearchPagination, wants_page_numbers
+from .search import search_posts, search_profiles, profile_name_filter
+from .suggestions import get_suggestions
+from .response_cache import cache_response, profile_versions
+from . import etags, jobs, metrics, response_cache, suggestions, timeline, warmup
+from .google_auth import verify_id_token
+from .throttling import LOGIN_THROTTLES, PASSWORD_THROTTLES, REGISTER_THROTTLES
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
+from django.utils import timezone
 
 # Create your views here.
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes(LOGIN_THROTTLES)
 def login_api(requets):
     identifier = requets.data.get('identifier')
     password = requets.data.get('password')
@@ -32,23 +36,20 @@ def login_api(requets):
             { "error": "All fields are required"},
             status=status.HTTP_400_BAD_REQUEST
         )
-    user = User.objects.filter(
-        models.Q(username=identifier) | models.Q(email=identifier)
-    ).first()
-
+    # Accepts a username or an email (see backends.py)
+    user = authenticate(requets, username=identifier, password=password)
     if user:
-        user = authenticate(username = user.username, password = password)
-        if user:
-            refresh = RefreshToken.for_user(user)
-            return Response(
-                {
-                  "refresh": str(refresh),
-                  "access": str(refresh.access_token),  
-                  "message": "Login Sucessfully",
-                 }
-            )
+        refresh = RefreshToken.for_user(user)
+        return Response(
+            {
+              "refresh": str(refresh),
+              "access": str(refresh.access_token),  
+              "message": "Login Sucessfully",
+             }
+        )
     return Response({"error": "Invalid credidential"}, status=status.HTTP_400_BAD_REQUEST)    
 
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def forget_password(request):
@@ -68,25 +69,18 @@ def forget_password(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    new_password = get_random_string(8)
-    user.set_password(new_password)
-    user.save()
-
-    send_mail(
-        'Password reset',
-        f"Your new password is {new_password}",
-        'noreply@yourapp.com',
-        [email],
-        fail_silently=False
-    )
+    # The worker generates the password and sends the email
+    jobs.enqueue('reset_password', user_id=user.pk)
 
     return Response(
         {"message": "New password sent to your email"},
         status=status.HTTP_200_OK
     )
 
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes(PASSWORD_THROTTLES)
 def change_password(request):
     """
     Change password for authenticated user
@@ -129,14 +123,15 @@ def change_password(request):
             'error': 'New password must be different from current password'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Set new password
-    user.set_password(new_password)
-    user.save()
-    
-    try:
-        send_mail(
-            'Password Changed Successfully',
-            f'''Hello {user.username},
+    # Set new password; the notification is only queued if the save commits
+    with transaction.atomic():
+        user.set_password(new_password)
+        user.save()
+
+        jobs.enqueue(
+            'send_email',
+            subject='Password Changed Successfully',
+            message=f'''Hello {user.username},
 
 Your password has been changed successfully.
 
@@ -144,20 +139,18 @@ If you did not make this change, please contact support immediately and reset yo
 
 Best regards,
 SocialNest Team''',
-            settings.DEFAULT_FROM_EMAIL or 'noreply@socialnest.com',
-            [user.email],
-            fail_silently=True  # Don't fail if email doesn't send
+            recipient_list=[user.email],
+            from_email=settings.DEFAULT_FROM_EMAIL or 'noreply@socialnest.com',
         )
-    except Exception as e:
-        # print(f"Password change email failed: {e}")
-    
-        return Response({
+
+    return Response({
         'message': 'Password changed successfully'
     }, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes(PASSWORD_THROTTLES)
 def change_password_without_old(request):
     """
     Change password without old password (for verified users/admin)
@@ -189,13 +182,10 @@ def change_password_without_old(request):
         'message': 'Password changed successfully'
     }, status=status.HTTP_200_OK)
 
+
 def get_or_create_user_from_google_token(token):
     try:
-        idinfo = id_token.verify_oauth2_token(
-            token,
-            google_requests.Request(),
-            settings.GOOGLE_CLIENT_ID
-        )
+        idinfo = verify_id_token(token)
 
         email = idinfo.get("email")
         name = idinfo.get("name")
@@ -210,6 +200,7 @@ def get_or_create_user_from_google_token(token):
     except ValueError:
         return None
 
+
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def google_login(request):
@@ -231,50 +222,113 @@ def google_login(request):
 @permission_classes([IsAuthenticated])
 def current_user(request):
     """Get current user with profile"""
-    serializer = UserSerializer(request.user, context={'request': request})
-    return Response(serializer.data)
+    user = request.user
+    etag = etags.make_etag(etags.viewer(request), user.username, user.email, user.profile.updated_at)
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+
+    serializer = UserSerializer(user, context={'request': request})
+    return etags.tag(Response(serializer.data), etag)
+
+
+def post_list_queryset():
+    """Posts with everything PostsSerializer touches loaded up front"""
+    # A sliced prefetch runs as one windowed query for the whole page
+    latest_comments = Comment.objects.select_related('user').order_by('-created_at', '-id')[:COMMENT_PREVIEW_SIZE]
+    return Post.objects.select_related('user__profile').prefetch_related(
+        Prefetch('comments', queryset=latest_comments, to_attr='comment_preview')
+    )
+
+
+def post_page_queryset(search):
+    """Bare rows for the post list: all the ETag needs, before any serializing"""
+    posts = Post.objects.only('id', 'updated_at').annotate(
+        author_updated_at=F('user__profile__updated_at')
+    )
+    if search:
+        return search_posts(posts, search)
+    return posts.order_by("-id")
+
+
+def post_page_etag(request, paginator, page):
+    return etags.make_etag(
+        etags.viewer(request),
+        [(post.id, post.updated_at, post.author_updated_at) for post in page],
+        paginator.get_paginated_response([]).data,
+    )
+
+
+def post_page_response(request, paginator, page, loaded, etag, context=None):
+    """Serialize a page of the post list from its full rows, `loaded` by id"""
+    posts = [loaded[post.id] for post in page if post.id in loaded]
+    serializer = PostsSerializer(posts, many=True, context={"request": request, **(context or {})})
+    return etags.tag(paginator.get_paginated_response(serializer.data), etag)
+
+
+def post_paginator(request, search):
+    # Relevance order has no stable keyset, so search results keep page numbers
+    if search or wants_page_numbers(request):
+        return PostPagination()
+    return PostCursorPagination()
 
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticatedOrReadOnly])
+@cache_response('post_list', lambda request: ['posts'])
 def post_api(request):
 
     if request.method == 'GET':
-        search = request.GET.get("search", "")
+        search = request.GET.get("search", "").strip()
 
-        posts = Post.objects.filter(
-            Q(title__icontains=search) |
-            Q(content__icontains=search)
-        ).order_by("-id")
+        paginator = post_paginator(request, search)
+        page = paginator.paginate_queryset(post_page_queryset(search), request)
+        etag = post_page_etag(request, paginator, page)
+        if etags.matches(request, etag):
+            return etags.not_modified(etag)
 
-        paginator = PostPagination()
-        paginated_posts = paginator.paginate_queryset(posts, request)
-        serializer = PostsSerializer(paginated_posts, many=True, context ={"request": request})
-
-        return paginator.get_paginated_response(serializer.data)
+        loaded = post_list_queryset().in_bulk([post.id for post in page])
+        return post_page_response(request, paginator, page, loaded, etag)
 
     elif request.method == 'POST':
-        serializer = PostsSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return create_post(request)
+
+
+def create_post(request):
+    serializer = PostsSerializer(data=request.data)
+    if serializer.is_valid():
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def home_feed(request):
+    """Posts from the people the current user follows, newest first"""
+    paginator = TimelinePagination()
+    posts = paginator.paginate_timeline(post_list_queryset(), request.user.profile, request)
+    serializer = PostsSerializer(posts, many=True, context={"request": request})
+    return paginator.get_paginated_response(serializer.data)
+
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def my_post(request):
-    search = request.GET.get("search", "")
+    search = request.GET.get("search", "").strip()
 
-    posts = Post.objects.filter(user = request.user).filter(
-        Q(title__icontains=search) |
-        Q(content__icontains=search)
-    ).order_by("-id")    
-    paginator = PostPagination()
+    posts = post_list_queryset().filter(user = request.user)
+    if search:
+        posts = search_posts(posts, search)
+    else:
+        posts = posts.order_by("-id")
+    paginator = post_paginator(request, search)
     paginated_posts = paginator.paginate_queryset(posts, request)
-    serializer = PostsSerializer(paginated_posts, many=True)
+    serializer = PostsSerializer(paginated_posts, many=True, context={"request": request})
 
     return paginator.get_paginated_response(serializer.data)
 
+
 @api_view(['PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def post_detail(request, post_id):
@@ -300,25 +354,82 @@ def post_detail(request, post_id):
             status=status.HTTP_200_OK
         )
 
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def LikePostView(request, post_id):
     post = Post.objects.get(id=post_id)
 
-    like, created = Like.objects.get_or_create(
-        user=request.user,
-        post=post
-    )
+    # Like row and post.likes_count change together (see signals.py)
+    with transaction.atomic():
+        like, created = Like.objects.get_or_create(
+            user=request.user,
+            post=post
+        )
 
-    if not created:
-        like.delete()
-        return Response({"liked": False})
+        if not created:
+            like.delete()
 
-    return Response({"liked": True})
+    likes_count = Post.objects.values_list('likes_count', flat=True).get(id=post_id)
+    return Response({"liked": created, "likes_count": likes_count})
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
+
+def batch_ids(request):
+    """
+    (ids, error response) for ?ids=1,2,3 (or repeated ids=). Distinct ids
+    in request order, at most BATCH_MAX_IDS of them.
+    """
+    raw = [value for values in request.GET.getlist('ids') for value in values.split(',') if value.strip()]
+    if not raw:
+        return None, Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw))
+    except ValueError:
+        return None, Response({'error': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(ids) > settings.BATCH_MAX_IDS:
+        return None, Response(
+            {'error': f'At most {settings.BATCH_MAX_IDS} ids per request'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return ids, None
+
+
+@api_view(['GET'])
+def likes_state(request):
+    """Like count, and whether the viewer liked it, for each post in ?ids="""
+    ids, error = batch_ids(request)
+    if error:
+        return error
+
+    counts = dict(Post.objects.filter(id__in=ids).values_list('id', 'likes_count'))
+    liked = set(liked_post_ids(request.user, counts)) if request.user.is_authenticated and counts else set()
+
+    return Response({
+        'results': [
+            {'post_id': post_id, 'liked': post_id in liked, 'likes_count': counts[post_id]}
+            for post_id in ids if post_id in counts
+        ]
+    })
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticatedOrReadOnly])
 def CommentCreateView(request, post_id):
+    if request.method == 'GET':
+        if not Post.objects.filter(id=post_id).exists():
+            return Response(
+                {"error": "Post not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        comments = Comment.objects.filter(post_id=post_id).select_related('user')
+        paginator = CommentPagination()
+        page = paginator.paginate_queryset(comments, request)
+        serializer = CommentSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     post = Post.objects.get(id=post_id)
 
     text = request.data.get("text")
@@ -329,18 +440,22 @@ def CommentCreateView(request, post_id):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    comment = Comment.objects.create(
-        user=request.user,
-        post=post,
-        text=text
-    )
+    # Comment row and post.comments_count change together (see signals.py)
+    with transaction.atomic():
+        comment = Comment.objects.create(
+            user=request.user,
+            post=post,
+            text=text
+        )
 
     serializer = CommentSerializer(comment)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
-        
+
+
 @csrf_exempt    
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes(REGISTER_THROTTLES)
 def RegisterView(request):
     serializer = RegisterSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
@@ -356,7 +471,7 @@ def RegisterView(request):
         'refresh': str(refresh),
         'message': 'User registered successfully'
     }, status=status.HTTP_201_CREATED)
-    
+
 
 @api_view(['PUT', 'PATCH'])
 @permission_classes([IsAuthenticated])
@@ -381,101 +496,67 @@ def update_profile(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def suggestions_to_follow(request):
-    """Get suggestions for users to follow"""
-    # print("\n" + "="*60)
-    # print("SUGGESTIONS API CALLED")
-    # print(f"Request user: {request.user.username} (ID: {request.user.id})")
-    
-    try:
-        current_user = request.user
-        current_profile = current_user.profile
-        
-        # print(f"Current profile ID: {current_profile.id}")
-        
-        following_profiles = current_profile.followers.all()
-        # print(f"\n{current_user.username} is currently following {following_profiles.count()} users:")
-        for profile in following_profiles:
-            # print(f"  - {profile.user.username} (Profile ID: {profile.id}, User ID: {profile.user.id})")
-        
-        # Get IDs of users already followed
-         following_ids = current_profile.followers.values_list('id', flat=True)
-        #  print(f"\nFollowing profile IDs: {list(following_ids)}")
-        
-        # Get all other profiles
-        #  all_other_profiles = Profile.objects.exclude(user=current_user)
-        #  print(f"\nTotal other profiles: {all_other_profiles.count()}")
-        
-         suggestions = Profile.objects.exclude(
-            user=current_user
-        ).exclude(
-            id__in=following_ids
-        ).order_by('?')[:5]
-        
-        # print(f"\nSelected {suggestions.count()} suggestions:")
-        for profile in suggestions:
-            # Check is_following manually
-            is_following = current_profile.followers.filter(id=profile.id).exists()
-            # print(f"  - {profile.user.username} (User ID: {profile.user.id}): is_following={is_following}")
-        
-        # print(f"\nSerializing suggestions with context:")
-        # print(f"  Request in context: {'request' in locals()}")
-        
-        serializer = ProfileSerializer(
-            suggestions, 
-            many=True,
-            context={'request': request}  
-        )
-        
-        # print(f"\nSerialized data preview:")
-        for i, data in enumerate(serializer.data[:3]):
-            # print(f"  [{i}] {data.get('username')}: is_following={data.get('is_following')}")
-        
-        # print("\n" + "="*60)
-        
-         return Response(serializer.data)
-        
-    except Exception as e:
-        # print(f"ERROR in suggestions_to_follow: {e}")
-        import traceback
-        traceback.print_exc()
-        # print("="*60)
-        
-        return Response(
-            {'error': 'Could not load suggestions'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+    """Get suggestions for users to follow, ranked by mutual follows"""
+    ranked = get_suggestions(request.user.profile)
+
+    paginator = SuggestionPagination()
+    page = paginator.paginate_queryset(ranked, request)
+
+    profiles = Profile.objects.select_related('user').in_bulk([profile_id for profile_id, _ in page])
+    page = [(profiles[profile_id], mutual) for profile_id, mutual in page if profile_id in profiles]
+
+    serializer = ProfileSerializer(
+        [profile for profile, _ in page],
+        many=True,
+        context={'request': request}
+    )
+    data = serializer.data
+    for item, (_, mutual) in zip(data, page):
+        item['mutual_count'] = mutual
+
+    return paginator.get_paginated_response(data)
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def search_users(request):
     """
-    Search users by username
+    Search users by username, exact and prefix matches first
     """
     query = request.query_params.get('q', '').strip()
 
     if not query:
-        return Response([])
+        return Response({'next': None, 'results': []})
+
+    paginator = UserSearchPagination()
+    page = paginator.paginate_queryset(user_search_queryset(request.user.profile, query), request)
+    return profile_page_response(request, paginator, page)
+
 
-    current_profile = request.user.profile
+def user_search_queryset(current_profile, query):
+    # Profiles already followed
+    following_ids = Follow.objects.filter(follower=current_profile).values('profile_id')
 
-    # IDs of users already followed
-    following_ids = current_profile.followers.values_list('id', flat=True)
+    return search_profiles(
+        Profile.objects.select_related('user').exclude(
+            id=current_profile.id
+        ).exclude(
+            id__in=following_ids
+        ),
+        query
+    )
 
-    users = Profile.objects.filter(
-        user__username__icontains=query
-    ).exclude(
-        user=request.user
-    ).exclude(
-        id__in=following_ids
-    )[:10]
 
+def profile_page_response(request, paginator, page):
     serializer = ProfileSerializer(
-        users,
+        page,
         many=True,
         context={'request': request}
     )
 
-    return Response(serializer.data)    
+    return paginator.get_paginated_response(serializer.data)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def follow_user(request):
@@ -488,176 +569,290 @@ def follow_user(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    if action not in ('follow', 'unfollow'):
+        return Response(
+            {'error': 'Invalid action'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
     try:
-        target_user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
+        target_profile = Profile.objects.get(user_id=user_id)
+    except Profile.DoesNotExist:
         return Response(
             {'error': 'User not found'},
             status=status.HTTP_404_NOT_FOUND
         )
 
-    current_profile = request.user.profile
-    target_profile = target_user.profile
-
-    # print(f"\n{'='*60}")
-    # print(f"FOLLOW ACTION: {action}")
-    # print(f"Current user: {request.user.username} (Profile ID: {current_profile.id})")
-    # print(f"Target user: {target_user.username} (Profile ID: {target_profile.id})")
-    
-    if action == 'follow':
-        # CORRECT: Current user follows target user
-        # So add current_profile to target_profile's followers
-        # This means: target_profile.followers.add(current_profile)
-        
-        # print(f"Before follow - Who follows target? (target's followers): {list(target_profile.followers.values_list('user__username', flat=True))}")
-        # print(f"Before follow - Who current follows? (current's following): {list(current_profile.following.values_list('user__username', flat=True))}")
-        
-        # Add current_profile to target's followers
-        target_profile.followers.add(current_profile)
-        
-        is_following = True
-        # print(f"After follow - Who follows target? (target's followers): {list(target_profile.followers.values_list('user__username', flat=True))}")
-        # print(f"After follow - Who current follows? (current's following): {list(current_profile.following.values_list('user__username', flat=True))}")
-
-    elif action == 'unfollow':
-        # print(f"Before unfollow - Who follows target? (target's followers): {list(target_profile.followers.values_list('user__username', flat=True))}")
-        # print(f"Before unfollow - Who current follows? (current's following): {list(current_profile.following.values_list('user__username', flat=True))}")
-        
-        # Remove current_profile from target's followers
-        target_profile.followers.remove(current_profile)
-        
-        is_following = False
-        # print(f"After unfollow - Who follows target? (target's followers): {list(target_profile.followers.values_list('user__username', flat=True))}")
-        # print(f"After unfollow - Who current follows? (current's following): {list(current_profile.following.values_list('user__username', flat=True))}")
-
-    else:
+    if target_profile.user_id == request.user.pk:
         return Response(
-            {'error': 'Invalid action'},
+            {'error': 'You cannot follow yourself'},
             status=status.HTTP_400_BAD_REQUEST
         )
-    
-    # print(f"{'='*60}")
-    
+
+    with transaction.atomic():
+        # Follow changes by the same user wait on this lock, so was_following
+        # still holds when the counters move
+        current_profile = Profile.objects.select_for_update().get(user_id=request.user.pk)
+        was_following = Follow.objects.filter(profile=target_profile, follower=current_profile).exists()
+
+        # Current user follows target user, so current_profile goes into
+        # target_profile's followers. The follow signals keep both profiles'
+        # stored counters in sync.
+        if action == 'follow':
+            target_profile.followers.add(current_profile)
+            is_following = True
+        else:
+            target_profile.followers.remove(current_profile)
+            is_following = False
+
+        # Read the counters back after the write: target_profile was loaded
+        # before the lock, and other users may have followed it since
+        counters = {
+            pk: (followers_count, following_count)
+            for pk, followers_count, following_count in Profile.objects.filter(
+                pk__in=[target_profile.pk, current_profile.pk]
+            ).values_list('pk', 'followers_count', 'following_count')
+        }
+
     return Response({
         'success': True,
         'is_following': is_following,
-        'followers_count': target_profile.followers.count(),
-        'following_count': current_profile.following.count()  
+        'followers_count': counters[target_profile.pk][0],
+        'following_count': counters[current_profile.pk][1]
     })
-@api_view(['GET'])
+
+
+@api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def get_followers(request):
-    """Get users who follow the current user with search"""
-    try:
-        profile = request.user.profile
-        search_query = request.GET.get('search', '').strip()
-        
-        # People who follow current user
-        followers = profile.followers.all()
-        
-        # Apply search if provided
-        if search_query:
-            followers = followers.filter(
-                Q(user__username__icontains=search_query) |
-                Q(user__email__icontains=search_query)
-            )
-        
-        # Pagination
-        page = int(request.GET.get('page', 1))
-        page_size = 10
-        start = (page - 1) * page_size
-        end = start + page_size
-        
-        total_count = followers.count()
-        paginated_followers = followers[start:end]
-        
-        serializer = ProfileSerializer(
-            paginated_followers, 
-            many=True,
-            context={'request': request}
+def follow_batch(request):
+    """
+    Many follow/unfollow actions in one transaction. The Follow rows are
+    written in bulk, which sends no signals, so the counter, timeline and
+    cache updates signals.py would make per row are made here per batch.
+    """
+    serializer = FollowBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    actions = {action['user_id']: action['action'] for action in serializer.validated_data['actions']}
+    with transaction.atomic():
+        # Serializes this user's follow changes (see follow_user), so the
+        # was_following snapshot below stays true until the commit
+        current_profile = Profile.objects.select_for_update().get(user_id=request.user.pk)
+        targets = {
+            profile.user_id: profile
+            for profile in Profile.objects.filter(user_id__in=actions).exclude(
+                pk=current_profile.pk
+            ).only('id', 'user_id', 'followers_count')
+        }
+        was_following = set(
+            Follow.objects.select_for_update().filter(
+                follower=current_profile,
+                profile__in=targets.values()
+            ).values_list('profile_id', flat=True)
         )
-        
-        return Response({
-            "followers_count": total_count,
-            "followers": serializer.data,
-            "has_next": end < total_count,
-            "has_previous": page > 1,
-            "current_page": page,
-            "total_pages": (total_count + page_size - 1) // page_size
+
+        followed = [
+            profile for user_id, profile in targets.items()
+            if actions[user_id] == 'follow' and profile.pk not in was_following
+        ]
+        unfollowed = [
+            profile for user_id, profile in targets.items()
+            if actions[user_id] == 'unfollow' and profile.pk in was_following
+        ]
+
+        if followed:
+            # No ignore_conflicts: a duplicate would mean the snapshot is wrong,
+            # and failing beats counting a follow that was not inserted
+            Follow.objects.bulk_create(
+                [Follow(profile=profile, follower=current_profile) for profile in followed]
+            )
+            Profile.objects.filter(pk__in=[profile.pk for profile in followed]).update(
+                followers_count=F('followers_count') + 1, updated_at=timezone.now()
+            )
+            timeline.backfill_authors(current_profile.pk, followed)
+
+        if unfollowed:
+            unfollowed_ids = [profile.pk for profile in unfollowed]
+            Follow.objects.filter(follower=current_profile, profile_id__in=unfollowed_ids).delete()
+            Profile.objects.filter(pk__in=unfollowed_ids).update(
+                followers_count=F('followers_count') - 1, updated_at=timezone.now()
+            )
+            timeline.prune([current_profile.pk], unfollowed_ids)
+
+        delta = len(followed) - len(unfollowed)
+        if followed or unfollowed:
+            Profile.objects.filter(pk=current_profile.pk).update(
+                following_count=F('following_count') + delta, updated_at=timezone.now()
+            )
+            suggestions.invalidate([current_profile.pk])
+            response_cache.bump(*(
+                f'profile:{profile.user_id}' for profile in [current_profile, *followed, *unfollowed]
+            ))
+
+        # Read the counters back after the writes: other users' follows of
+        # the targets aren't held off by this user's lock
+        counters = {
+            pk: (followers_count, following_count)
+            for pk, followers_count, following_count in Profile.objects.filter(
+                pk__in=[current_profile.pk, *(profile.pk for profile in targets.values())]
+            ).values_list('pk', 'followers_count', 'following_count')
+        }
+
+    results = []
+    for user_id, action in actions.items():
+        profile = targets.get(user_id)
+        if profile is None:
+            error = 'You cannot follow yourself' if user_id == request.user.pk else 'User not found'
+            results.append({'user_id': user_id, 'success': False, 'error': error})
+            continue
+        results.append({
+            'user_id': user_id,
+            'success': True,
+            'is_following': action == 'follow',
+            'followers_count': counters[profile.pk][0],
         })
-    except Exception as e:
-        return Response(
-            {'error': str(e)},
-            status=status.HTTP_400_BAD_REQUEST
+
+    return Response({
+        'results': results,
+        'following_count': counters[current_profile.pk][1],
+    })
+
+
+def follow_list_response(request, links, side, total_count, key):
+    """Keyset-paginated page of the profiles on `side` of the Follow rows in `links`"""
+    paginator, links = follow_page_queryset(request, links, side)
+    if follow_search_query(request):
+        # The stored counter covers the whole list; a search counts its matches
+        total_count = links.count()
+    page = paginator.paginate_queryset(links, request)
+    return follow_page_response(request, paginator, page, side, total_count, key)
+
+
+def follow_search_query(request):
+    return request.GET.get('search', '').strip()
+
+
+def follow_page_queryset(request, links, side):
+    """(paginator, Follow rows to page through) for a followers/following list"""
+    search_query = follow_search_query(request)
+
+    # Apply search if provided
+    if search_query:
+        links = links.filter(
+            profile_name_filter(search_query, f'{side}__search_name') |
+            Q(**{f'{side}__user__email__icontains': search_query})
         )
 
+    paginator = FollowPagination()
+    if request.GET.get('order') == 'oldest':
+        paginator.ordering = ('created_at', 'id')
+    return paginator, links.select_related(f'{side}__user')
+
+
+def follow_page_response(request, paginator, page, side, total_count, key):
+    serializer = ProfileSerializer(
+        [getattr(link, side) for link in page],
+        many=True,
+        context={'request': request}
+    )
+
+    return Response({
+        f"{key}_count": total_count,
+        key: serializer.data,
+        "next": paginator.get_next_link(),
+        "has_next": paginator.has_next,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_followers(request):
+    """Get users who follow the current user with search, newest first"""
+    profile = request.user.profile
+    return follow_list_response(
+        request,
+        Follow.objects.filter(profile=profile),
+        'follower',
+        profile.followers_count,
+        'followers',
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_following(request):
-    """Get users that the current user is following with search"""
-    try:
-        profile = request.user.profile
-        search_query = request.GET.get('search', '').strip()
-        
-        # People that current user follows
-        following = profile.following.all()
-        
-        # Apply search 
-        if search_query:
-            following = following.filter(
-                Q(user__username__icontains=search_query) |
-                Q(user__email__icontains=search_query)
-            )
-        
-        # Pagination
-        page = int(request.GET.get('page', 1))
-        page_size = 10
-        start = (page - 1) * page_size
-        end = start + page_size
-        
-        total_count = following.count()
-        paginated_following = following[start:end]
-        
-        serializer = ProfileSerializer(
-            paginated_following, 
-            many=True,
-            context={'request': request}
-        )
-        
-        return Response({
-            "following_count": total_count,
-            "following": serializer.data,
-            "has_next": end < total_count,
-            "has_previous": page > 1,
-            "current_page": page,
-            "total_pages": (total_count + page_size - 1) // page_size
-        })
-    except Exception as e:
-        return Response(
-            {'error': str(e)},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    """Get users that the current user is following with search, newest first"""
+    profile = request.user.profile
+    return follow_list_response(
+        request,
+        Follow.objects.filter(follower=profile),
+        'profile',
+        profile.following_count,
+        'following',
+    )
+
+
 @api_view(['GET'])
+@cache_response('user_profile', lambda request, username: profile_versions(username))
 def user_profile(request, username):
     """Get user profile with follow status"""
-    try:
-        user = User.objects.get(username=username)
-        profile = user.profile
-        
-        serializer = ProfileSerializer(
-            profile,
-            context={'request': request}
-        )
-        
-        return Response(serializer.data)
-    except User.DoesNotExist:
-        return Response(
-            {'error': 'User not found'},
-            status=status.HTTP_404_NOT_FOUND
-        )
+    stamp = profile_stamp_queryset(username).first()
+    if stamp is None:
+        return profile_not_found()
+
+    etag = etags.make_etag(etags.viewer(request), username, stamp)
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+
+    profile = Profile.objects.select_related('user').get(user__username=username)
+    return profile_response(request, profile, etag)
+
+
+def profile_stamp_queryset(username):
+    # Renames and follows all move the profile's updated_at
+    return Profile.objects.filter(user__username=username).values_list('updated_at', flat=True)
+
+
+def profile_not_found():
+    return Response(
+        {'error': 'User not found'},
+        status=status.HTTP_404_NOT_FOUND
+    )
+
+
+def profile_response(request, profile, etag):
+    serializer = ProfileSerializer(
+        profile,
+        context={'request': request}
+    )
+
+    return etags.tag(Response(serializer.data), etag)
+
+
+@api_view(['GET'])
+def profiles_batch(request):
+    """Profiles for the user ids in ?ids=, in request order; unknown ids are left out"""
+    user_ids, error = batch_ids(request)
+    if error:
+        return error
+
+    profiles = {
+        profile.user_id: profile
+        for profile in Profile.objects.select_related('user').filter(user_id__in=user_ids)
+    }
+    serializer = ProfileSerializer(
+        [profiles[user_id] for user_id in user_ids if user_id in profiles],
+        many=True,
+        context={'request': request}
+    )
+
+    return Response({'results': serializer.data})
+
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@throttle_classes(PASSWORD_THROTTLES)
 def delete_account(request):
     user = request.user
     password = request.data.get("password")
@@ -681,3 +876,28 @@ def delete_account(request):
         {"message": "Account deleted successfully"},
         status=status.HTTP_204_NO_CONTENT
     )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def service_metrics(request):
+    """Counters from metrics.py (throttle rejections, ...)"""
+    return Response(metrics.snapshot())
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def readiness(request):
+    """Warm-up status and a database ping, for load balancer health checks"""
+    database = warmup.ping_database()
+    ready = warmup.is_warm() and database['ok']
+
+    return Response(
+        {
+            'status': 'ready' if ready else 'unavailable',
+            'warmup': warmup.state,
+            'database': database,
+        },
+        status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
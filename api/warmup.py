@@ -0,0 +1,151 @@
+"""
+Process warm-up, so a fresh worker's first requests don't pay for it.
+
+Two phases:
+
+* ``preload()`` imports the heavy modules, builds the URL resolver and
+  serializer fields and fetches Google's signing keys. It opens no
+  sockets that can't survive a fork, so under gunicorn's preload_app it
+  runs once in the master (backend/wsgi.py calls it) and the workers
+  share the result copy-on-write.
+* ``warm_worker()`` opens the connections each process needs for itself,
+  the database and the cache. gunicorn.conf.py runs it in every worker
+  before it accepts requests, and backend/asgi.py at import.
+
+``state`` records what ran and how long it took; /api/health/ready
+reports it and only answers 200 once every step that was meant to run
+succeeded.
+"""
+import importlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from . import images
+
+logger = logging.getLogger(__name__)
+
+# Imported on the first request otherwise; the app defers the last few
+# until first use so manage.py commands don't pay for them
+MODULES = (
+    'api.views',
+    'api.async_views',
+    'api.serializers',
+    'rest_framework_simplejwt.authentication',
+    'google.auth.jwt',
+    'requests',
+    'django.core.mail',
+    'magic',
+    'PIL.Image',
+)
+
+state = {
+    'preload': None,
+    'worker': None,
+}
+
+# Set where warm_worker() runs after the fork; readiness then waits for it
+_worker_expected = False
+
+_lock = threading.Lock()
+
+
+def _run(steps):
+    """Run (name, callable) steps; a failing step is logged, not fatal"""
+    report = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as exc:
+            logger.exception('Warm-up step %s failed', name)
+            report[name] = {'ok': False, 'error': str(exc)}
+        else:
+            report[name] = {'ok': True, 'ms': round((time.perf_counter() - start) * 1000, 1)}
+    return report
+
+
+def _import_modules():
+    for module in MODULES:
+        importlib.import_module(module)
+    from PIL import Image
+    # Registers every image plugin up front instead of on the first open()
+    Image.init()
+    images.use_webp()
+
+
+def _build_urls():
+    from django.urls import get_resolver
+    get_resolver().reverse_dict
+
+
+def _build_serializers():
+    from .serializers import PostsSerializer, ProfileSerializer, UserSerializer
+    for serializer in (PostsSerializer, ProfileSerializer, UserSerializer):
+        serializer().fields
+
+
+def _load_google_keys():
+    from . import google_auth
+    # A network fetch; runserver reloads too often to pay for it
+    if settings.GOOGLE_CLIENT_ID and not settings.DEBUG:
+        google_auth.keys.get()
+
+
+def _ping_database():
+    from django.db import connection
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def _ping_cache():
+    from django.core.cache import cache
+    cache.get('warmup:ping')
+
+
+def preload():
+    """Fork-safe warm-up; runs once per process"""
+    with _lock:
+        if state['preload'] is None:
+            state['preload'] = _run([
+                ('imports', _import_modules),
+                ('urls', _build_urls),
+                ('serializers', _build_serializers),
+                ('google_keys', _load_google_keys),
+            ])
+    return state['preload']
+
+
+def warm_worker():
+    """Per-process connections; call after the fork"""
+    preload()
+    state['worker'] = _run([
+        ('database', _ping_database),
+        ('cache', _ping_cache),
+    ])
+    return state['worker']
+
+
+def expect_worker():
+    """Hold readiness until warm_worker() has run in this process"""
+    global _worker_expected
+    _worker_expected = True
+
+
+def _all_ok(report):
+    return report is not None and all(step['ok'] for step in report.values())
+
+
+def is_warm():
+    if not _all_ok(state['preload']):
+        return False
+    if state['worker'] is None:
+        return not _worker_expected
+    return _all_ok(state['worker'])
+
+
+def ping_database():
+    """{'ok': ..., 'ms' or 'error': ...} for one SELECT 1"""
+    return _run([('database', _ping_database)])['database']
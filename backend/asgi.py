@@ -12,5 +12,18 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Serve the read-heavy endpoints from api/async_views.py
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
+
+# Imports and caches that would otherwise be loaded on the first request
+from api import warmup  # noqa: E402
+from django.db import connections  # noqa: E402
+
+warmup.preload()
+# Requests run their ORM calls in asgiref's executor thread, which opens its
+# own connection; this one only proves the database and cache answer before
+# the server starts taking traffic, so it is closed again
+warmup.warm_worker()
+connections.close_all()
@@ -9,6 +9,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-default-dev-key')
 
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
+# Callable returning (certs, max_age) for Google ID-token verification
+GOOGLE_CERTS_FETCHER = os.environ.get('GOOGLE_CERTS_FETCHER', 'api.google_auth.fetch_google_certs')
 
 
 ALLOWED_HOSTS = [
@@ -54,6 +56,18 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
+    # Proxies in front of the app whose X-Forwarded-For entries are trusted.
+    # 0 keys per-IP throttles on REMOTE_ADDR; behind one load balancer
+    # (Render, nginx) set NUM_PROXIES=1 so clients can't pick their own IP.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    # Rate limits for the password-hashing endpoints (see api/throttling.py)
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.environ.get('THROTTLE_LOGIN_IP', '20/min'),
+        'login_identifier': os.environ.get('THROTTLE_LOGIN_IDENTIFIER', '5/min'),
+        'register_ip': os.environ.get('THROTTLE_REGISTER_IP', '10/hour'),
+        'password_ip': os.environ.get('THROTTLE_PASSWORD_IP', '20/min'),
+        'password_user': os.environ.get('THROTTLE_PASSWORD_USER', '5/min'),
+    },
 }
 
 SIMPLE_JWT = {
@@ -63,7 +77,8 @@ SIMPLE_JWT = {
 }
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    # ModelBackend that also accepts an email address as the username
+    'api.backends.EmailOrUsernameModelBackend',
 ]
 
 # CORS Settings
@@ -111,6 +126,21 @@ else:
         }
     }
 
+if os.environ.get('REDIS_URL'):
+    # Shared cache across workers (needs the `redis` package)
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -150,9 +180,20 @@ USE_TZ = True
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Hand media responses to the front server: 'x-accel-redirect' (nginx, with
+# an internal location at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or
+# 'x-sendfile' (Apache/lighttpd). Unset, Django sends them (api/media.py).
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# max-age for media that isn't stored under a content hash
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 60 * 60))
 
 # Email settings
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Emails are sent by the job worker (manage.py run_jobs). For offline work
+# set EMAIL_BACKEND to django.core.mail.backends.console.EmailBackend, or
+# to ...filebased.EmailBackend to write them under EMAIL_FILE_PATH.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -174,6 +215,26 @@ if not DEBUG:
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    # Load balancer probes come over plain HTTP
+    SECURE_REDIRECT_EXEMPT = [r'^api/health/']
+
+# Home timeline: authors with more followers than this are pulled on read
+# instead of being fanned out to every follower's timeline on write
+TIMELINE_FANOUT_LIMIT = int(os.environ.get('TIMELINE_FANOUT_LIMIT', 10000))
+
+# Seconds a user's ranked follow suggestions stay cached
+SUGGESTIONS_CACHE_TTL = int(os.environ.get('SUGGESTIONS_CACHE_TTL', 15 * 60))
+
+# Upper bound on how long an anonymous response stays cached; writes
+# invalidate them sooner by bumping versions (see api/response_cache.py)
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 60))
+
+# Most ids (or follow actions) one batch endpoint request may name
+BATCH_MAX_IDS = int(os.environ.get('BATCH_MAX_IDS', 100))
+
+# Route the read-heavy endpoints to their async versions (api/async_views.py).
+# backend/asgi.py turns this on; WSGI workers keep the sync views.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
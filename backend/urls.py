@@ -15,21 +15,21 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
+from api.media import serve_media
 
 
 urlpatterns = [
     path('adminx1/', admin.site.urls),
     path('api/', include('api.urls')),
+    # Uploaded media, with or without DEBUG (see api/media.py)
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', serve_media, name='media'),
 ]
 
-if settings.DEBUG or not settings.DEBUG:  
-    urlpatterns += static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT
-    )
+if settings.DEBUG:
+    # WhiteNoise serves collected static files in production
     urlpatterns += static(
         settings.STATIC_URL,
         document_root=settings.STATIC_ROOT
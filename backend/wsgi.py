@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Imports and caches that every worker would otherwise load on its first
+# request; under gunicorn's preload_app this runs once, in the master
+from api import warmup  # noqa: E402
+
+warmup.preload()
@@ -0,0 +1,31 @@
+"""
+gunicorn settings for the web process (see backend/Procfile).
+
+The app is imported once in the master, which also runs the fork-safe
+half of the warm-up (api/warmup.py, from backend/wsgi.py); workers fork
+from it and share those pages copy-on-write. Each worker then opens its
+own database and cache connections before it accepts requests.
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = True
+
+
+def when_ready(server):
+    from api import warmup
+    from django.db import connections
+
+    # Workers fork from here; they report ready only after post_worker_init
+    warmup.expect_worker()
+    # Nothing the master opened is handed down to the workers
+    connections.close_all()
+    # Keep the collector from touching (and so copying) the preloaded objects
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from api import warmup
+    warmup.warm_worker()